@@ -0,0 +1,250 @@
+"""What hypo itself costs: dispatch latency, throughput, summary/metrics writes, memory per Run.
+
+It runs on a CPU only machine, the GPUs are faked. The results are written as JSON,
+to compare two commits:
+
+    python benchmarks/bench.py --out before.json
+    git checkout other-branch
+    python benchmarks/bench.py --out after.json --compare before.json
+
+`--quick` uses smaller sizes, `--only latency,throughput` picks the benchmarks.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from hypo import Experiment, Run  # noqa: E402
+from hypo import journal, metrics  # noqa: E402
+from hypo.dispatch import Dispatcher  # noqa: E402
+from hypo.resources import FakeGPUs  # noqa: E402
+
+GPUS = FakeGPUs([24000] * 8)
+
+
+@contextmanager
+def _workdir():
+    """A fresh cwd, for the summary and the journal of each launch."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hypo-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(cwd)
+
+
+def _launch(runs, **kwargs):
+    from loguru import logger
+
+    logger.remove()  # the log goes to a file, not to the terminal, which is slower and noisy
+    sink = logger.add("hypo.log")
+    try:
+        Experiment().launch(runs, gpu_provider=GPUS, logs="file", **kwargs)
+    finally:
+        logger.remove(sink)
+
+
+def _percentiles(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "mean": statistics.fmean(values),
+    }
+
+
+def bench_build(n: int) -> dict:
+    """The time to build the Run list itself."""
+    with _workdir():
+        start = time.perf_counter()
+        runs = [Run(name=f"r{i}", command="true", output=f"out/{i % 10}") for i in range(n)]
+        took = time.perf_counter() - start
+    return {"n": len(runs), "total_s": took, "per_run_us": took / n * 1e6}
+
+
+def bench_memory(n: int) -> dict:
+    """The memory of a Run waiting in the dispatcher."""
+    with _workdir():
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        dispatcher = Dispatcher()
+        for i in range(n):
+            dispatcher.put(Run(name=f"r{i}", command=f"python main.py --seed {i}", output="out"), priority=(0, 0))
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return {"n": len(dispatcher), "total_bytes": size, "per_run_bytes": size / n}
+
+
+def bench_latency(n: int) -> dict:
+    """From a queued run to its process start: the gaps between the runs on one worker, each
+    one writes its start time. The baseline is the same processes started by a bare loop."""
+    with _workdir() as tmp:
+        stamps = tmp / "stamps"
+        stamps.mkdir()
+        runs = [Run(name=f"r{i}", command=f"date +%s%N > {stamps}/{i}", gpus=0) for i in range(n)]
+        _launch(runs, max_workers=1)
+        starts = [int((stamps / str(i)).read_text()) / 1e9 for i in range(n)]
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+
+        base = []
+        for i in range(n):
+            subprocess.run(f"date +%s%N > {stamps}/base", shell=True, check=True)
+            base.append(int((stamps / "base").read_text()) / 1e9)
+        base_gaps = [b - a for a, b in zip(base, base[1:])]
+    latency = {k: v * 1e3 for k, v in _percentiles(gaps).items()}
+    baseline = {k: v * 1e3 for k, v in _percentiles(base_gaps).items()}
+    return {
+        "n": n,
+        "latency_ms": latency,
+        "baseline_ms": baseline,
+        "overhead_ms": latency["p50"] - baseline["p50"],
+    }
+
+
+def bench_throughput(n: int, workers: list, engines: list) -> dict:
+    """No-op commands per second, against the same processes started by a bare thread pool."""
+    results = {}
+    for w in workers:
+        with ThreadPoolExecutor(max_workers=w) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: subprocess.run("true", shell=True), range(n)))
+            baseline = n / (time.perf_counter() - start)
+        results[f"baseline/{w}"] = {"workers": w, "runs_per_s": baseline}
+        for engine in engines:
+            with _workdir():
+                runs = [Run(name=f"r{i}", command="true") for i in range(n)]
+                start = time.perf_counter()
+                _launch(runs, max_workers=w, engine=engine)
+                took = time.perf_counter() - start
+            results[f"{engine}/{w}"] = {
+                "workers": w,
+                "runs_per_s": n / took,
+                "overhead_per_run_ms": (took - n / baseline) / n * 1e3,
+            }
+    return results
+
+
+def bench_summary(sizes: list) -> dict:
+    """Appending the records of N runs to the journal, and building the summary from it."""
+    results = {}
+    with _workdir():
+        record = Run(name="r", command="python main.py --lr 0.1", output="out").asdict()
+        record.update(returncode=0, start_at="2024-01-01__00-00-00", time_consume="0:00:01")
+        for n in sizes:
+            path = f"summary-{n}.jsonl"
+            j = journal.Journal(path)
+            start = time.perf_counter()
+            for _ in range(n):
+                j.append(record)
+            j.close()
+            append = time.perf_counter() - start
+            start = time.perf_counter()
+            journal.build_summary(path, f"summary-{n}.json")
+            build = time.perf_counter() - start
+            results[str(n)] = {"append_per_record_us": append / n * 1e6, "build_s": build}
+    return results
+
+
+def bench_metrics(sizes: list) -> dict:
+    """`metrics.save` of N rows, and `metrics.compact` of them into a CSV."""
+    results = {}
+    with _workdir():
+        for n in sizes:
+            output = f"metrics-{n}.csv"
+            start = time.perf_counter()
+            for i in range(n):
+                metrics.save({"seed": i, "lr": 0.1}, {"acc": 0.5, "loss": 1.0}, output)
+            save = time.perf_counter() - start
+            start = time.perf_counter()
+            metrics.compact(output)
+            compact = time.perf_counter() - start
+            results[str(n)] = {"save_per_row_us": save / n * 1e6, "compact_s": compact}
+    return results
+
+
+def _commit() -> str:
+    try:
+        root = Path(__file__).resolve().parent.parent
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _leaves(d: dict, prefix=""):
+    for k, v in d.items():
+        if isinstance(v, dict):
+            yield from _leaves(v, f"{prefix}{k}.")
+        elif isinstance(v, (int, float)):
+            yield f"{prefix}{k}", v
+
+
+def compare(old: dict, new: dict):
+    """Print the numbers of two results side by side."""
+    old_values = dict(_leaves(old["results"]))
+    print(f"{'':60} {old['meta']['commit'][:8]:>12} {new['meta']['commit'][:8]:>12}")
+    for key, value in _leaves(new["results"]):
+        if key in old_values:
+            ratio = value / old_values[key] if old_values[key] else float("nan")
+            print(f"{key:60} {old_values[key]:12.4g} {value:12.4g}  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of hypo")
+    parser.add_argument("--out", default="bench.json", help="where to write the results")
+    parser.add_argument("--compare", default=None, help="former results to compare with")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke check")
+    parser.add_argument("--only", default=None, help="comma separated: build,memory,latency,throughput,summary,metrics")
+    args = parser.parse_args(argv)
+
+    scale = 0.1 if args.quick else 1
+    benchmarks = {
+        "build": lambda: bench_build(int(100000 * scale)),
+        "memory": lambda: bench_memory(int(100000 * scale)),
+        "latency": lambda: bench_latency(int(200 * scale) or 2),
+        "throughput": lambda: bench_throughput(int(1000 * scale), [1, 8, 64], ["thread", "async"]),
+        "summary": lambda: bench_summary([int(n * scale) for n in [1000, 10000, 100000]]),
+        "metrics": lambda: bench_metrics([int(n * scale) for n in [1000, 10000, 100000]]),
+    }
+    only = args.only.split(",") if args.only else list(benchmarks)
+
+    results = {}
+    for name in only:
+        start = time.perf_counter()
+        results[name] = benchmarks[name]()
+        print(f"[bench] {name} done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    output = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"[bench] results in {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,31 @@
-from .experiment import Experiment, Run, runs, run
-from .hypo import main
-from .ext import run_git_checkout, run_git_status
+import importlib
+
+# the names are imported on the first use, so `import hypo` stays cheap for the short processes
+_exports = {
+    "Experiment": ".experiment",
+    "Run": ".experiment",
+    "PyRun": ".experiment",
+    "runs": ".experiment",
+    "run": ".experiment",
+    "main": ".hypo",
+    "run_git_checkout": ".ext",
+    "run_git_status": ".ext",
+    "Cache": ".cache",
+    "Sweep": ".sweep",
+    "Pool": ".pool",
+    "Staging": ".staging",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
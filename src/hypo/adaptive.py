@@ -0,0 +1,162 @@
+import os
+import threading
+from dataclasses import dataclass
+from .log import logger
+
+
+@dataclass
+class Sample:
+    """The state of this machine, None for what it does not tell."""
+
+    cpus: int
+    load: float = None  # 1 minute load average
+    cpu_idle: float = None  # idle share of the CPUs since the last sample, 0..1
+    mem_available: float = None  # available share of the memory, 0..1
+    cpu_pressure: float = None  # /proc/pressure "some avg10", % of the time stalled
+    mem_pressure: float = None
+    io_pressure: float = None
+
+
+class Probe:
+    """Read the load of this machine from /proc, with the load average as the fallback."""
+
+    def __init__(self) -> None:
+        self.cpus = os.cpu_count() or 1
+        self.last_stat = None
+
+    @staticmethod
+    def _pressure(kind: str):
+        try:
+            with open(f"/proc/pressure/{kind}", "r") as f:
+                some = f.readline().split()
+        except OSError:  # not Linux, or no PSI in the kernel
+            return None
+        return float(some[1].split("=")[1])
+
+    @staticmethod
+    def _mem_available():
+        try:
+            with open("/proc/meminfo", "r") as f:
+                info = {line.split(":")[0]: int(line.split()[1]) for line in f}
+            return info["MemAvailable"] / info["MemTotal"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _cpu_idle(self):
+        try:
+            with open("/proc/stat", "r") as f:
+                ticks = [int(x) for x in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle, total = ticks[3] + ticks[4], sum(ticks)  # idle + iowait
+        last, self.last_stat = self.last_stat, (idle, total)
+        if last is None or total == last[1]:
+            return None
+        return (idle - last[0]) / (total - last[1])
+
+    def sample(self) -> Sample:
+        try:
+            load = os.getloadavg()[0]
+        except (OSError, AttributeError):
+            load = None
+        return Sample(
+            cpus=self.cpus,
+            load=load,
+            cpu_idle=self._cpu_idle(),
+            mem_available=self._mem_available(),
+            cpu_pressure=self._pressure("cpu"),
+            mem_pressure=self._pressure("memory"),
+            io_pressure=self._pressure("io"),
+        )
+
+
+def decide(limit: int, running: int, queued: int, sample: Sample, floor: int, ceiling: int) -> tuple:
+    """The next limit of the runs at the same time, and why.
+
+    Back off by a quarter when the memory is short or stalled, or the CPUs or the disks are
+    overloaded. Ramp up by half of the idle cores when all the slots are used and runs are
+    waiting, and the memory is fine.
+    """
+    if sample.mem_available is not None and sample.mem_available < 0.1:
+        return max(floor, limit - max(1, limit // 4)), "memory short"
+    if sample.mem_pressure is not None and sample.mem_pressure > 10:
+        return max(floor, limit - max(1, limit // 4)), "memory stalled"
+    if sample.io_pressure is not None and sample.io_pressure > 40:
+        return max(floor, limit - max(1, limit // 4)), "io stalled"
+    if sample.load is not None and sample.load > 1.5 * sample.cpus:
+        return max(floor, limit - max(1, limit // 4)), "overloaded"
+
+    if running < limit or queued == 0:  # the limit is not what holds the runs
+        return limit, "hold"
+    if sample.mem_available is not None and sample.mem_available < 0.25:
+        return limit, "hold, memory"
+    if sample.cpu_pressure is not None and sample.cpu_pressure > 20:
+        return limit, "hold, cpu stalled"
+    if sample.cpu_idle is not None:
+        idle = sample.cpu_idle * sample.cpus
+    elif sample.load is not None:
+        idle = sample.cpus - sample.load
+    else:
+        return limit, "hold, no load info"
+    if idle < 0.5:
+        return limit, "hold, cpus busy"
+    return min(ceiling, limit + max(1, int(idle / 2))), "cpus idle"
+
+
+class Controller:
+    """Adapt the number of runs at the same time on this node between `floor` and `ceiling`.
+
+    Every `interval` seconds, the machine is sampled and the limit changed by `decide`.
+    A run takes a slot when it is dispatched; a lower limit does not stop the running
+    ones, no more runs start until they are below it.
+
+    Args:
+        floor (int): The least number of runs at the same time, also the start.
+        ceiling (int): The most number of runs at the same time.
+        interval (float): Seconds between the samples.
+        queued (callable): The number of the runs waiting in the queue.
+        wake (callable): Called when the limit is raised, the waiting runs could go.
+    """
+
+    def __init__(self, floor: int, ceiling: int, interval=2.0, queued=lambda: 0, wake=lambda: None) -> None:
+        assert 1 <= floor <= ceiling, "It should be 1 <= floor <= ceiling."
+        self.floor = floor
+        self.ceiling = ceiling
+        self.interval = interval
+        self.queued = queued
+        self.wake = wake
+        self.limit = floor
+        self.running = 0
+        self.lock = threading.Lock()
+        self.probe = Probe()
+        self.probe.sample()  # the first CPU ticks
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._control, name="hypo-adaptive", daemon=True)
+        self.thread.start()
+
+    def try_take(self) -> bool:
+        with self.lock:
+            if self.running >= self.limit:
+                return False
+            self.running += 1
+            return True
+
+    def give(self):
+        with self.lock:
+            self.running -= 1
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _control(self):
+        while not self.stopped.wait(self.interval):
+            sample = self.probe.sample()
+            queued = self.queued()  # not under the lock, the dispatcher takes it while holding its own
+            with self.lock:
+                limit, reason = decide(self.limit, self.running, queued, sample, self.floor, self.ceiling)
+                old, self.limit = self.limit, limit
+            if limit != old:
+                logger.info(f"[ADAPTIVE] {old} -> {limit} workers, {reason}: {sample}")
+            if limit > old:
+                self.wake()
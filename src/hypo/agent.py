@@ -0,0 +1,317 @@
+import argparse
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .log import logger
+from .resources import GPU, GPUProvider, CUDAs, CountedResources, default_provider, default_capacities
+from .nodes import Nodes
+
+
+class AgentLost(Exception):
+    """The connection to an agent is broken, the run sequence sent to it goes back to the queue."""
+
+
+def _token() -> str:
+    # a shared secret between the coordinator and the agents, the agents run any command they get
+    return os.environ.get("HYPO_AGENT_TOKEN", "")
+
+
+def _loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:  # a name
+        return False
+
+
+def _keepalive(sock: socket.socket, idle=10, interval=5, count=3):
+    """Notice a node which is gone without closing the connection (power off, network down)."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in [("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)]:
+        if hasattr(socket, name):  # Linux
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+
+class AgentGPUs(GPUProvider):
+    """The GPUs an agent advertises, for the `CUDAs` of the agent on the coordinator."""
+
+    def __init__(self, gpus: list) -> None:
+        self.gpus = [GPU(g["id"], g["memory"]) for g in gpus]
+
+    def devices(self) -> list:
+        return self.gpus
+
+
+class Agent:
+    """A `hypo agent` on another node, seen from the coordinator.
+
+    It has the `cudas` and `counted` resources the agent advertises, the coordinator
+    grants them to the run sequences like the ones of its own node, and sends the
+    commands to the agent. A broken connection raises `AgentLost`.
+
+    Args:
+        address (str): "host:port" of the agent.
+        timeout (float): The timeout in seconds to connect, and of the requests but `/run`.
+    """
+
+    def __init__(self, address: str, timeout=10) -> None:
+        host, _, port = address.rpartition(":")
+        self.host = host or "localhost"
+        self.port = int(port)
+        self.address = f"{self.host}:{self.port}"
+        self.timeout = timeout
+        self.alive = False
+
+        info = self.ping()
+        if info is None:
+            raise AgentLost(f"The agent {self.address} is not reachable.")
+        self.name = info["host"]
+        self.max_workers = info["max_workers"]
+        self.dataroot = info.get("dataroot")
+        self.cudas = CUDAs(max_workers=self.max_workers, provider=AgentGPUs(info["gpus"]))
+        self.counted = CountedResources(info["resources"])
+        logger.info(f"[AGENT] {self.name} at {self.address}, {self.max_workers} workers")
+
+    def _request(self, method: str, path: str, body=None, timeout=None):
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.connect()
+                _keepalive(conn.sock)
+                conn.sock.settimeout(timeout)
+                conn.request(
+                    method,
+                    path,
+                    body=None if body is None else json.dumps(body).encode(),
+                    headers={"Content-Type": "application/json", "X-Hypo-Token": _token()},
+                )
+                response = conn.getresponse()
+                data = response.read()
+            finally:
+                conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            raise AgentLost(f"{self.address}: {e!r}") from e
+        if response.status != 200:
+            raise Exception(f"The agent {self.address} failed {path}: {response.status} {data.decode(errors='replace')}")
+        return json.loads(data)
+
+    def ping(self):
+        """The info of the agent, None if it is not reachable. A reachable agent is alive again."""
+        try:
+            info = self._request("GET", "/info", timeout=self.timeout)
+        except AgentLost:
+            self.alive = False
+            return None
+        self.alive = True
+        return info
+
+    def execute(self, running, env: dict, timeout=None):
+        """Run the process of one run on the agent, blocks until it exits.
+
+        Args:
+            env (dict): The environment variables to set on the agent, over its own ones.
+            timeout (float): Kill the processes of the run after this number of seconds.
+        """
+        payload = {
+            "run": {
+                "name": running.name,
+                "command": running.command,
+                "cwd": str(running.cwd),
+                "output": str(running.output),
+                "datetime": running.datetime,
+                "revision": running.revision,
+                "timeout": timeout,
+                "datasets": running.datasets,
+            },
+            "env": env,
+        }
+        if running.resource is not None:  # the locks are on the coordinator
+            running.resource.acquire()
+        try:
+            result = self._request("POST", "/run", payload, timeout=None)
+            running.returncode = result["returncode"]
+            for k in ["stdout", "stderr", "worktree", "usage", "timed_out", "staged"]:
+                if result.get(k) is not None:
+                    setattr(running, k, result[k])
+        except AgentLost:
+            raise
+        except Exception as e:
+            running.returncode = None
+            print(e)
+        finally:
+            if running.resource is not None:
+                running.resource.release()
+        running.node = self.address
+
+
+# ===== The agent side =====
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        if hmac.compare_digest(self.headers.get("X-Hypo-Token", "").encode(), _token().encode()):
+            return True
+        self._reply(403, {"error": "wrong HYPO_AGENT_TOKEN"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != "/info":
+            return self._reply(404, {"error": f"unknown path {self.path}"})
+        self._reply(200, self.server.info)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/run":
+            return self._reply(404, {"error": f"unknown path {self.path}"})
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        try:
+            result = self.server.run(body)
+        except Exception as e:
+            logger.exception(e)
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, result)
+
+    def log_message(self, format, *args):
+        logger.debug(f"[AGENT] {self.address_string()} {format % args}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, info: dict, experiment) -> None:
+        super().__init__(address, _Handler)
+        self.info = info
+        self.experiment = experiment
+        self.paths = {}  # see `Run.resolve`
+
+    def run(self, body: dict) -> dict:
+        from .experiment import Run
+
+        running = Run(**body["run"])
+        running.resolve(self.paths)
+        env = os.environ.copy()
+        env.update(body.get("env") or {})
+        start_time = self.experiment.started(running)
+        self.experiment.execute(running, env)
+        logger.info(f"[FINISH {time.time() - start_time:.1f}s] {running.command}")
+        return {
+            "returncode": running.returncode,
+            "stdout": getattr(running, "stdout", None),
+            "stderr": getattr(running, "stderr", None),
+            "worktree": str(running.worktree) if getattr(running, "worktree", None) is not None else None,
+            "usage": getattr(running, "usage", None),
+            "timed_out": getattr(running, "timed_out", None),
+            "staged": getattr(running, "staged", None),
+        }
+
+
+def serve(
+    host="127.0.0.1",
+    port=7777,
+    max_workers=None,
+    cuda_visible_devices=None,
+    resources: dict = None,
+    logs="file",
+    gpu_provider: GPUProvider = None,
+    staging=None,
+    insecure=False,
+):
+    """Run the commands a coordinator sends to this node, until it is interrupted.
+
+    Args:
+        host (str): The address to listen on, "0.0.0.0" for the other nodes.
+        port (int): The port to listen on.
+        max_workers (int): The number of runs at the same time, the number of GPUs by default (at least 1).
+        cuda_visible_devices (set): The GPUs the coordinator could use, all by default.
+        resources (dict): The counted resources of this node, "cpu" and "ram" are there by default.
+        logs (str): "file", "tail" or "console", see `Experiment.launch`.
+        gpu_provider (GPUProvider): Where the GPUs come from, GPUtil by default.
+        staging (Staging): Copy the datasets of the runs onto the local disk of this node, see `Experiment.launch`.
+        insecure (bool): Listen on another address than the loopback without `HYPO_AGENT_TOKEN`.
+    """
+    if not _token() and not _loopback(host) and not insecure:
+        raise Exception(
+            f"HYPO_AGENT_TOKEN is not set, anyone who reaches {host}:{port} could run commands here."
+            " Set it, or start the agent with --insecure."
+        )
+    from .experiment import Experiment
+    from .logs import Logs
+    from .worktree import Worktrees
+
+    gpus = [g for g in (gpu_provider or default_provider()).devices() if cuda_visible_devices is None or g.id in cuda_visible_devices]
+    info = {
+        "host": socket.gethostname(),
+        "max_workers": max_workers or len(gpus) or 1,
+        "gpus": [{"id": g.id, "memory": g.memory} for g in gpus],
+        "resources": {**default_capacities(), **(resources or {})},
+        "dataroot": str(Nodes().dataroot),
+    }
+    experiment = Experiment()
+    experiment.logs = None if logs == "console" else Logs(tail=logs == "tail")
+    experiment.worktrees = Worktrees()
+    experiment.staging = staging
+
+    server = _Server((host, port), info, experiment)
+    logger.info(f"[AGENT] listening on {host}:{port}: {info}")
+    if not _token():
+        logger.warning("HYPO_AGENT_TOKEN is not set, anyone who reaches this port could run commands here.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if experiment.logs is not None:
+            experiment.logs.close()
+
+
+def main(argv: list = None):
+    """`hypo agent --host 0.0.0.0 --port 7777 --max-workers 4 --cuda 0,1 --resource license=2 --staging rsync`"""
+    from .staging import Staging
+
+    parser = argparse.ArgumentParser(prog="hypo agent", description="Run the runs a coordinator dispatches to this node")
+    parser.add_argument("--host", default="127.0.0.1", help='"0.0.0.0" to accept the other nodes')
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--cuda", default=None, help="the visible GPUs, e.g. 0,1")
+    parser.add_argument("--resource", action="append", default=[], help="a counted resource, e.g. license=2")
+    parser.add_argument("--logs", default="file", choices=["file", "tail", "console"])
+    parser.add_argument("--staging", default=None, choices=["copy", "rsync", "hardlink"], help="stage the datasets of the runs")
+    parser.add_argument("--staging-root", default=None, help="the local folder of the staged datasets")
+    parser.add_argument("--staging-max-gb", type=float, default=100.0)
+    parser.add_argument("--insecure", action="store_true", help="listen on another address than the loopback without a token")
+    args = parser.parse_args(argv)
+
+    resources = {}
+    for item in args.resource:
+        name, _, value = item.partition("=")
+        resources[name] = float(value)
+    serve(
+        host=args.host,
+        port=args.port,
+        max_workers=args.max_workers,
+        cuda_visible_devices=None if args.cuda is None else {int(x) for x in args.cuda.split(",") if x.strip()},
+        resources=resources,
+        logs=args.logs,
+        staging=None if args.staging is None else Staging(args.staging_root, args.staging_max_gb, args.staging),
+        insecure=args.insecure,
+    )
@@ -0,0 +1,110 @@
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from .log import logger
+from .dispatch import Closed
+from .experiment import PyRun
+from . import deadline, usage
+
+
+async def _launch(exp, running_candidate, grant, slots: asyncio.Semaphore, blocking: ThreadPoolExecutor):
+    """The asyncio version of `Experiment.worker` for one run sequence.
+
+    The blocking calls of the runs (the locks, the worktrees, the staging...) go to `blocking`, with a
+    thread for each run at the same time: a run waiting for a lock never takes the thread another
+    run needs to finish and release it. So do the records of the runs (the journal, the state, the
+    cache), the loop keeps draining the pipes of the other runs meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        seq = exp.sequence(running_candidate)
+        env = exp.make_env(grant.cudas)
+
+        # <launch>
+        for i, running in enumerate(seq):
+            if not exp.runnable(running):
+                continue
+            running.cuda_visible_devices = str(grant.cudas)
+            start_time = exp.started(running)
+            if exp.state is not None:
+                await loop.run_in_executor(blocking, exp.state.running, running)
+            if isinstance(running, PyRun):  # waits for a worker of the pool, out of the event loop
+                await loop.run_in_executor(blocking, exp.execute_call, running)
+                await loop.run_in_executor(blocking, exp.finished, running, start_time)
+                if exp.stop_sequence(seq, i):
+                    break
+                continue
+            if running.resource is not None:
+                # the resources are threading locks, wait for them out of the event loop
+                await loop.run_in_executor(blocking, running.resource.acquire)
+            capture = exp.open_logs(running)
+            try:
+                cwd = await loop.run_in_executor(blocking, exp.workdir, running)
+                datasets = await loop.run_in_executor(blocking, exp.stage, running)
+                timeout = exp.timeout_of(running)
+                process = subprocess.Popen(
+                    running.command,
+                    shell=True,
+                    cwd=cwd,
+                    env={**env, **datasets},
+                    stdout=None if capture is None else capture.stdout,
+                    stderr=None if capture is None else capture.stderr,
+                    **deadline.popen_kwargs(timeout),
+                )
+                exp.track(running, process)
+                timer = deadline.Deadline(process, timeout, loop=loop) if timeout else None
+                running.returncode, running.usage = await usage.async_wait(process)
+                if timer is not None:
+                    timer.cancel()
+                    running.timed_out = timer.expired
+                exp.untrack(running, process)
+                if running.returncode != 0:
+                    print(subprocess.CalledProcessError(running.returncode, running.command))
+            except Exception as e:
+                running.returncode = None
+                print(e)
+            await loop.run_in_executor(blocking, exp.close_logs, running, capture)
+            await loop.run_in_executor(blocking, exp.leave, running)
+
+            if running.resource is not None:
+                running.resource.release()
+            # </launch>
+
+            await loop.run_in_executor(blocking, exp.finished, running, start_time)
+            if exp.stop_sequence(seq, i):
+                break
+    except Exception as e:
+        logger.exception(e)
+    finally:
+        exp.release(grant)
+        try:
+            await loop.run_in_executor(blocking, exp.complete, running_candidate)
+        finally:
+            slots.release()
+
+
+async def serve(exp, max_workers: int):
+    """Drive all the runs of the experiment from one event loop, at most `max_workers` at the same time."""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_workers)
+    blocking = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="hypo-blocking")
+    tasks = set()
+    while True:
+        await slots.acquire()
+        try:
+            try:
+                running_candidate, grant = exp.dispatcher.get(block=False, acquire=exp.try_acquire)
+            except Empty:  # wait for the producer or the resources without blocking the running ones
+                running_candidate, grant = await loop.run_in_executor(
+                    None, lambda: exp.dispatcher.get(acquire=exp.try_acquire)
+                )
+        except Closed:
+            break
+        task = loop.create_task(_launch(exp, running_candidate, grant, slots, blocking))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+    blocking.shutdown()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import subprocess
+import time
+from functools import lru_cache
+from pathlib import Path
+from .log import logger
+
+
+@lru_cache(maxsize=None)
+def git_revision(cwd) -> str:
+    """The HEAD commit of the git repo at cwd, "" if it is not a git repo."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+@lru_cache(maxsize=None)
+def git_commit(cwd, revision: str) -> str:
+    """The commit of a branch / tag / commit of the git repo at cwd, the revision itself if it cannot be resolved."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--verify", f"{revision}^{{commit}}"], cwd=cwd, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return revision
+
+
+class Cache:
+    """Content addressed records of the finished runs, to skip the runs finished before.
+
+    The key of a run is the hash of its command, cwd, the values of the `env_keys`
+    environment variables, the git revision of its cwd (the commit of `Run.revision` if it is set)
+    and its `cache_key`.
+    The records are json files under `root`.
+
+    Args:
+        root (str): The folder of the records.
+        env_keys (list): The environment variables which change the result of a run.
+        mode (str): "use": skip the runs finished successfully before.
+                    "force": run everything, and record the results.
+                    "only-failed": run only the runs failed before, skip the others.
+                    Default by the `HYPO_CACHE` environment variable (`hypo --force`, `hypo --only-failed`), or "use".
+        max_entries (int): Keep at most this number of records, evict the least recently used.
+        max_age (float): Evict the records not used in this number of days.
+    """
+
+    modes = ("use", "force", "only-failed")
+
+    def __init__(self, root=".hypo/cache", env_keys=(), mode=None, max_entries=None, max_age=None) -> None:
+        self.root = Path(root).absolute()
+        self.env_keys = sorted(env_keys)
+        self.mode = mode or os.environ.get("HYPO_CACHE", "use")
+        assert self.mode in self.modes, f"The cache mode should be one of {self.modes}."
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, running) -> str:
+        if running.revision is None:
+            git = git_revision(str(running.cwd))
+        else:  # it runs in a worktree of this commit, not at the HEAD of cwd
+            git = git_commit(str(running.cwd), running.revision)
+        content = {
+            "command": running.command,
+            "cwd": str(running.cwd),
+            "env": {k: os.environ.get(k) for k in self.env_keys},
+            "git": git,
+            "cache_key": running.cache_key,
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, running):
+        """The record of the run finished before, or None."""
+        path = self._path(self.key(running))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        os.utime(path)  # used, for the LRU eviction
+        return record
+
+    def put(self, running):
+        path = self._path(self.key(running))
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(running.asdict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def skip(self, running):
+        """The record to use instead of running it, or None if it should run.
+
+        The record is {} for a run skipped by "only-failed" which never ran before.
+        """
+        if self.mode == "force":
+            return None
+        record = self.get(running)
+        succeeded = record is not None and record.get("returncode") == 0
+        if self.mode == "only-failed":
+            # an empty record: never ran, skip it too
+            return None if record is not None and not succeeded else (record or {})
+        return record if succeeded else None
+
+    def evict(self):
+        """Remove the records older than `max_age` days, then the least recently used beyond `max_entries`."""
+        entries = sorted(self.root.glob("*/*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        removed = []
+        if self.max_age is not None:
+            deadline = time.time() - self.max_age * 24 * 3600
+            removed += [p for p in entries if p.stat().st_mtime < deadline]
+            entries = [p for p in entries if p.stat().st_mtime >= deadline]
+        if self.max_entries is not None:
+            removed += entries[self.max_entries:]
+        for p in removed:
+            p.unlink(missing_ok=True)
+        if removed:
+            logger.info(f"Evicted {len(removed)} records from the cache {self.root}")
+
+    def clear(self):
+        for p in self.root.glob("*/*.json"):
+            p.unlink(missing_ok=True)
@@ -1,22 +1,37 @@
 import argparse
-from loguru import logger
+import sys
+from .log import logger
 
-parser = argparse.ArgumentParser(
-    prog="Hypothesis",
-    description="CLI to launch all experiments",
-    epilog="Enjoy the training",
-)
-parser.add_argument(
-    "method",
-    type=str,
-)
+# the commands of hypo itself, they parse their own args (`hypo resume --force`)
+COMMANDS = ("summary", "status", "ls", "resume", "agent")
 
-# There could be unknown args, so use parse_known_args
-args, subargs = parser.parse_known_args()
 
-if "." in args.method:
-    args.load_module, args.method = args.method.rsplit(".", 1)
-else:
-    args.load_module = "index"
+def parse(argv: list = None):
+    """Parse the command line of `hypo`. Returns (args, the unknown args for the experiment)."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        args = argparse.Namespace(method=argv[0], load_module=None, force=False, only_failed=False)
+        return args, argv[1:]
 
-logger.info(f"\033[34m[Hypo]: {args}. [Experiments args]: {subargs}")
+    parser = argparse.ArgumentParser(
+        prog="Hypothesis",
+        description="CLI to launch all experiments",
+        epilog="Enjoy the training",
+    )
+    parser.add_argument(
+        "method",
+        type=str,
+    )
+    parser.add_argument("--force", action="store_true", help="run everything, even if finished before (cache)")
+    parser.add_argument("--only-failed", action="store_true", help="run only the runs failed before (cache)")
+
+    # There could be unknown args, so use parse_known_args
+    args, subargs = parser.parse_known_args(argv)
+
+    if "." in args.method:
+        args.load_module, args.method = args.method.rsplit(".", 1)
+    else:
+        args.load_module = "index"
+
+    logger.info(f"\033[34m[Hypo]: {args}. [Experiments args]: {subargs}")
+    return args, subargs
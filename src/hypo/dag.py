@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import defaultdict
+
+
+def _as_sequence(running_candidate) -> list:
+    return running_candidate if isinstance(running_candidate, list) else [running_candidate]
+
+
+def _ok(running) -> bool:
+    # a run skipped by the cache without a record has no returncode, it does not fail its children
+    return getattr(running, "returncode", 0) == 0 and not getattr(running, "skipped", None)
+
+
+class Graph:
+    """The dependencies between the runs, declared by `Run.after`.
+
+    A run (or a run sequence) is ready when all the runs it is after are done, and the
+    runs which `produce` the artifacts it is after are done. If one of them fails, it is
+    skipped, and so are the runs after it. An artifact with no producer must exist.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.producers = {}  # artifact path -> the run producing it
+        self.waiting = {}  # id of the run sequence -> [run sequence, ids of the unfinished parents]
+        self.children = defaultdict(list)  # id of the parent run -> ids of the waiting run sequences
+        self.active = 0  # the run sequences added and not finished: waiting, queued or running
+        self.rank = {}  # id of the run sequence -> length of the longest path to the end, see `declare`
+
+    def _parents(self, running_candidate) -> list:
+        members = {id(x) for x in running_candidate}
+        parents = {}
+        for running in running_candidate:
+            for dep in running.after or []:
+                if isinstance(dep, (str, os.PathLike)):
+                    path = os.path.abspath(dep)
+                    if path not in self.producers:
+                        if not os.path.exists(path):
+                            raise Exception(f"{running.name} is after {path}, but no run produces it.")
+                        continue
+                    parent = self.producers[path]
+                else:
+                    parent = dep
+                if id(parent) not in members:
+                    parents[id(parent)] = parent
+        return list(parents.values())
+
+    def add(self, running_candidate) -> str:
+        """"ready", "waiting" for its parents, or "skipped" because a parent failed."""
+        seq = _as_sequence(running_candidate)
+        with self.lock:
+            parents = self._parents(seq)
+            for running in seq:
+                for path in running.produces or []:
+                    self.producers[os.path.abspath(path)] = running
+            # the state is kept on the runs, they are alive as long as a child refers to them
+            if any(getattr(p, "state", None) == "failed" for p in parents):
+                return "skipped"
+            parents = {id(p) for p in parents if getattr(p, "state", None) != "done"}
+            self.active += 1
+            if not parents:
+                return "ready"
+            self.waiting[id(running_candidate)] = [running_candidate, parents]
+            for parent in parents:
+                self.children[parent].append(id(running_candidate))
+            return "waiting"
+
+    def finish(self, running_candidate):
+        """The run sequence is done. Returns (the ones ready now, the ones skipped because it failed)."""
+        ready, skipped = [], []
+        with self.lock:
+            self.active -= 1
+            finished = [(running, _ok(running)) for running in _as_sequence(running_candidate)]
+            while finished:
+                running, ok = finished.pop()
+                running.state = "done" if ok else "failed"
+                for key in self.children.pop(id(running), []):
+                    if key not in self.waiting:  # skipped by another failed parent
+                        continue
+                    child, parents = self.waiting[key]
+                    if ok:
+                        parents.discard(id(running))
+                        if not parents:
+                            del self.waiting[key]
+                            ready.append(child)
+                    else:
+                        del self.waiting[key]
+                        self.active -= 1
+                        skipped.append(child)
+                        # its runs are failed for their own children
+                        finished += [(x, False) for x in _as_sequence(child)]
+        return ready, skipped
+
+    def stuck(self) -> list:
+        """The waiting run sequences, if nothing else is queued or running, they will never be ready
+        (a cycle, or a parent never added). They are removed."""
+        with self.lock:
+            if not self.waiting or self.active > len(self.waiting):
+                return []
+            stuck = [child for child, _ in self.waiting.values()]
+            self.waiting.clear()
+            self.children.clear()
+            self.active = 0
+            return stuck
+
+    def declare(self, runs: list, weight=lambda running_candidate: 1):
+        """Declare a whole list of runs before adding them: the producers of the artifacts, so a
+        run could be before its producer in the list, and the critical path rank of each run
+        sequence: its weight plus the longest rank of the ones after it. The higher the rank,
+        the sooner it should start."""
+        owner = {}  # run id -> run sequence id
+        producers = {}
+        for item in runs:
+            for running in _as_sequence(item):
+                owner[id(running)] = id(item)
+                for path in running.produces or []:
+                    producers[os.path.abspath(path)] = running
+        children = defaultdict(set)
+        for item in runs:
+            for running in _as_sequence(item):
+                for dep in running.after or []:
+                    if isinstance(dep, (str, os.PathLike)):
+                        parent = id(producers.get(os.path.abspath(dep)))
+                    else:
+                        parent = id(dep)
+                    if parent in owner and owner[parent] != id(item):
+                        children[owner[parent]].add(id(item))
+
+        items = {id(item): item for item in runs}
+        rank = {}
+        visiting = set()  # on the current path, an edge back to it is a cycle and ignored
+        for key in items:  # iterative DFS, the lists could be long
+            stack = [(key, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    rank[node] = weight(items[node]) + max((rank.get(c, 0) for c in children[node]), default=0)
+                    visiting.discard(node)
+                elif node not in rank and node not in visiting:
+                    visiting.add(node)
+                    stack.append((node, True))
+                    stack += [(c, False) for c in children[node] if c not in rank and c not in visiting]
+        with self.lock:
+            self.rank.update(rank)
+            self.producers.update(producers)
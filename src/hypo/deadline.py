@@ -0,0 +1,87 @@
+import os
+import signal
+import sys
+import threading
+from .log import logger
+
+_groups = set()  # the process groups of the running runs with a timeout
+_groups_lock = threading.Lock()
+
+
+def popen_kwargs(timeout) -> dict:
+    """A run with a timeout is started in its own process group, to kill all its processes.
+
+    The others stay in the group of hypo, so they get the Ctrl-C of the terminal as before.
+    """
+    if not timeout:
+        return {}
+    if sys.version_info >= (3, 11):
+        return {"process_group": 0}
+    return {"start_new_session": True}
+
+
+def _signal(pgid: int, sig):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):  # all exited
+        pass
+
+
+def interrupt():
+    """Ctrl-C: the runs in their own process group did not get it from the terminal, pass it on."""
+    with _groups_lock:
+        groups = list(_groups)
+    for pgid in groups:
+        _signal(pgid, signal.SIGINT)
+
+
+class Deadline:
+    """Kill the process group of a run after `timeout` seconds: SIGTERM, then SIGKILL after `grace`.
+
+    Args:
+        process (subprocess.Popen): Started with `popen_kwargs(timeout)`.
+        timeout (float): Seconds.
+        grace (float): Seconds between SIGTERM and SIGKILL.
+        loop (asyncio.AbstractEventLoop): The event loop of the async engine, a timer thread otherwise.
+    """
+
+    def __init__(self, process, timeout: float, grace=10.0, loop=None) -> None:
+        self.pgid = process.pid
+        self.timeout = timeout
+        self.grace = grace
+        self.expired = False
+        self.killer = None
+        self.lock = threading.Lock()  # the timer thread kills while the worker cancels
+        self.done = False
+        with _groups_lock:
+            _groups.add(self.pgid)
+        if loop is not None:
+            self.timer = loop.call_later(timeout, self.kill)
+        else:
+            self.timer = threading.Timer(timeout, self.kill)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def kill(self):
+        with self.lock:
+            if self.done:
+                return
+            self.expired = True
+            logger.warning(f"[TIMEOUT {self.timeout}s] kill the process group {self.pgid}")
+            _signal(self.pgid, signal.SIGTERM)
+            # the processes which ignore SIGTERM
+            self.killer = threading.Timer(self.grace, _signal, (self.pgid, signal.SIGKILL))
+            self.killer.daemon = True
+            self.killer.start()
+
+    def cancel(self):
+        """The process exited. After a timeout, the processes left in its group are killed now:
+        once the group is gone, its id could be reused by another one before the grace."""
+        self.timer.cancel()
+        with self.lock:
+            self.done = True
+            if self.killer is not None:
+                self.killer.cancel()
+                _signal(self.pgid, signal.SIGKILL)
+        with _groups_lock:
+            _groups.discard(self.pgid)
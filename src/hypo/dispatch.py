@@ -0,0 +1,100 @@
+import heapq
+import itertools
+import threading
+from queue import Empty
+
+
+class Closed(Exception):
+    """Raised by `Dispatcher.get` when the dispatcher is closed and nothing is left."""
+
+
+class Dispatcher:
+    """A thread safe priority queue between the producer of runs and the workers.
+
+    Lower priority value is dispatched first, the same priority keeps the FIFO order.
+    `put` blocks while `maxsize` items are waiting (back-pressure on the producer),
+    `get` blocks while it is empty, and raises `Closed` after `close()` once drained.
+    Both are O(log n) in the number of waiting items.
+
+    Args:
+        maxsize (int): The max number of waiting items. 0 means unbounded.
+        lookahead (int): The max number of items `get` tries to grant resources to.
+    """
+
+    def __init__(self, maxsize: int = 0, lookahead: int = 256) -> None:
+        self.maxsize = maxsize
+        self.lookahead = lookahead
+        self._heap = []
+        self._counter = itertools.count()  # tie breaker, keep FIFO for the same priority
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, item, priority: int = 0, force: bool = False):
+        """Put an item, wait while it is full unless `force` (e.g. from a worker, which must not wait for itself)."""
+        with self._not_full:
+            while not force and not self._closed and 0 < self.maxsize <= len(self._heap):
+                self._not_full.wait()
+            if self._closed:
+                raise Closed("Put into a closed dispatcher.")
+            heapq.heappush(self._heap, (priority, next(self._counter), item))
+            self._not_empty.notify()
+
+    def get(self, block: bool = True, acquire=None):
+        """Take the most urgent item.
+
+        With `acquire`, take the most urgent item which `acquire(item)` grants resources to
+        (not None), skipping the ones waiting for resources, and return (item, grant).
+        At most `lookahead` items are tried each time, then it waits for `wake()`.
+
+        Raises `queue.Empty` if `block` is False and nothing could be taken now.
+        """
+        with self._not_empty:
+            while True:
+                if self._heap:
+                    taken = self._take(acquire)
+                    if taken is not None:
+                        self._not_full.notify()
+                        return taken
+                elif self._closed:
+                    raise Closed()
+                if not block:
+                    raise Empty()
+                self._not_empty.wait()
+
+    def _take(self, acquire):
+        if acquire is None:
+            return heapq.heappop(self._heap)[2]
+        skipped = []
+        try:
+            while self._heap and len(skipped) < self.lookahead:
+                entry = heapq.heappop(self._heap)
+                grant = acquire(entry[2])
+                if grant is not None:
+                    return entry[2], grant
+                skipped.append(entry)
+            return None
+        finally:
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+
+    def wake(self):
+        """Resources are released, the waiting `get` try again."""
+        with self._lock:
+            self._not_empty.notify_all()
+
+    def close(self):
+        """No more items will be put. The workers exit once the waiting items are done."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
@@ -1,23 +1,32 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 import os
-import shutil
-from multiprocessing import Process, Queue, queues
-from concurrent.futures import as_completed, ThreadPoolExecutor
-import subprocess
 import sys
 import threading
 import time
+from functools import lru_cache
 from pathlib import Path
-import GPUtil
-import json
 import datetime
-import csv
+import json
 import pprint
-from loguru import logger
-from .resources import CUDAs, Resources, GlobalResources
-from time import strftime, localtime
-from alive_progress import alive_bar
+from typing import TYPE_CHECKING
+from .log import logger
+from .resources import CUDAs, Resources, GPUProvider, default_provider, CountedResources, Grant
+from .dispatch import Dispatcher, Closed
+from .dag import Graph, _as_sequence, _ok
+from . import deadline, journal, usage
+from .adaptive import Controller
+from .pool import Pool
+from .status import Status
+from .history import History, makespan, seconds
+
+# the heavy modules are imported where they are used, `import hypo` is done by many short processes
+if TYPE_CHECKING:
+    from .state import State
+    from .staging import Staging
+    from .cache import Cache
+    from .worktree import Worktrees
+    from .logs import Logs, Capture
 
 
 def givename(value=None):
@@ -33,7 +42,69 @@ def givename(value=None):
             return datetime.datetime.now().strftime("%Y-%m-%d__%H-%M-%S")
 
 
-@dataclass
+@lru_cache(maxsize=None)
+def _process_name() -> str:
+    """The default `Run.datetime`: the same for all the runs of this process, named on the first run."""
+    return givename()
+
+
+# the runs are slotted where dataclasses can be, a sweep holds many of them
+_slots = {"slots": True} if sys.version_info >= (3, 10) else {}
+_UNSET = object()
+
+
+@dataclass(**_slots)
+class Record:
+    """What happens to a run in a launch, its fields are unset until then. `Run.asdict` writes them."""
+
+    start_at: str = _UNSET
+    finish_at: str = _UNSET
+    time_consume: str = _UNSET
+    returncode: int = _UNSET
+    attempts: int = _UNSET
+    cached: bool = _UNSET
+    skipped: str = _UNSET
+    worktree: Path = _UNSET
+    cuda_visible_devices: str = _UNSET
+    usage: dict = _UNSET
+    node: str = _UNSET
+    stdout: str = _UNSET
+    stderr: str = _UNSET
+    result: object = _UNSET  # the return value of a `PyRun`
+    timed_out: bool = _UNSET
+    state: str = _UNSET  # "done" or "failed", for the runs after it
+    staged: dict = _UNSET  # the variable -> the local path of each dataset
+
+
+class _Recorded:
+    """An attribute of the run kept in its `Record`: an AttributeError until it is set, as before."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, running, owner=None):
+        if running is None:
+            return self
+        value = _UNSET if running._record is None else getattr(running._record, self.name)
+        if value is _UNSET:
+            raise AttributeError(self.name)
+        return value
+
+    def __set__(self, running, value):
+        if running._record is None:
+            running._record = Record()
+        setattr(running._record, self.name, value)
+
+    def __delete__(self, running):
+        if running._record is not None:
+            setattr(running._record, self.name, _UNSET)
+
+
+def _intern(path):
+    return sys.intern(path) if isinstance(path, str) else path
+
+
+@dataclass(**_slots)
 class Run:
     """A run is a task to run in a process. A run is a command to run.
 
@@ -42,6 +113,28 @@ class Run:
         command (str): The command to run. nessary
         input (str): The input path. not nessary
         output (str): The output path. nessary
+        priority (int): Lower value is dispatched first. not nessary
+        cache_key (str): Part of the key in the result cache, e.g. the version of the dataset. not nessary
+        revision (str): Run in a git worktree of this branch / commit of the repo at cwd. not nessary
+        gpus (int): The number of GPUs, 0 for a CPU only run. 1 by default. not nessary
+        gpu_memory (float): The memory in MB needed on each GPU. not nessary
+        gpu_share (float): The share of each GPU, e.g. 0.25. One worker slot by default. not nessary
+        requires (dict): The counted resources, e.g. {"cpu": 4, "ram": 16, "license": 1}. Granted together
+            with the GPUs, all or nothing. `resource` instead is a lock taken by this run alone. not nessary
+        after (list): The runs, or the artifact paths, this run waits for. It is skipped if one of them fails. not nessary
+        produces (list): The artifact paths this run produces, for the `after` of the other runs. not nessary
+        timeout (float): Kill all its processes after this number of seconds. `launch(timeout=)` by default. not nessary
+        retries (int): Run it again this number of times if it fails. `launch(retries=)` by default. not nessary
+        duration (float): The expected seconds, for `launch(order="longest")`. From the former runs by default. not nessary
+        sweep_id (str), params (dict): The combination of a `Sweep` the run is made of. not nessary
+        datasets (dict): The environment variable -> the dataset path it is set to, e.g. {"DATA_ROOT": "/nfs/imagenet"}.
+            With `launch(staging=)`, the path of its copy on the local disk of the node instead. not nessary
+
+    The cwd, the output and the datasets are made absolute, and the output folder is created, by the launch
+    (`resolve`), not here: building a run costs no system call. What happens to the run in
+    the launch (returncode, start_at, usage...) is in its `Record`, read as its attributes.
+
+    The cwd and the output should be on a shared file system if the run could go to an agent on another node.
 
     If you want to init this dataclass for dict, use:
 
@@ -56,12 +149,71 @@ class Run:
     # The cwd for process start.
     cwd: str = "."
     output: str = "."
-    datetime: str = givename()  # as start time
+    datetime: str = field(default_factory=_process_name)  # as start time
+    priority: int = 0
+    cache_key: str = None
+    revision: str = None
+    gpus: int = None
+    gpu_memory: float = None
+    gpu_share: float = None
+    requires: dict = None
+    after: list = None
+    produces: list = None
+    timeout: float = None
+    retries: int = None
+    duration: float = None
+    input: str = None
+    sweep_id: str = None
+    params: dict = None
+    datasets: dict = None
+    _record: Record = field(default=None, init=False, repr=False, compare=False)
+    _row: int = field(default=None, init=False, repr=False, compare=False)  # (launch, number) of it in the `State`
+
+    start_at = _Recorded()
+    finish_at = _Recorded()
+    time_consume = _Recorded()
+    returncode = _Recorded()
+    attempts = _Recorded()
+    cached = _Recorded()
+    skipped = _Recorded()
+    worktree = _Recorded()
+    cuda_visible_devices = _Recorded()
+    usage = _Recorded()
+    node = _Recorded()
+    stdout = _Recorded()
+    stderr = _Recorded()
+    result = _Recorded()
+    timed_out = _Recorded()
+    state = _Recorded()
+    staged = _Recorded()
 
     def __post_init__(self):
-        self.output = Path(self.output).absolute()
-        self.cwd = Path(self.cwd).absolute()
-        self.output.mkdir(parents=True, exist_ok=True)
+        # the equal paths of many runs are one str, and one Path after `resolve`
+        self.output = _intern(self.output)
+        self.cwd = _intern(self.cwd)
+
+    def resolve(self, paths: dict):
+        """Make the cwd, the output and the datasets absolute, and create the output folder once per folder.
+
+        Args:
+            paths (dict): The cache of the launch, the path as given -> its absolute Path.
+        """
+        for key in ("cwd", "output"):
+            path = getattr(self, key)
+            absolute = paths.get(path)
+            if absolute is None:
+                absolute = paths[path] = Path(path).absolute()
+                if key == "output":
+                    absolute.mkdir(parents=True, exist_ok=True)
+            setattr(self, key, absolute)
+        if self.datasets:  # the same path with or without `staging`, whatever the cwd of the run
+            datasets = {}
+            for k, path in self.datasets.items():
+                absolute = paths.get(path)
+                if absolute is None:
+                    absolute = paths[path] = Path(path).absolute()
+                datasets[k] = str(absolute)
+            self.datasets = datasets
 
     def _except_call_back(self, e: Exception):
         logger.exception(f"Error\n{self.command}")
@@ -78,26 +230,92 @@ class Run:
             "output": str(self.output),
             "datetime": self.datetime,
         }
-        if hasattr(self, "time_consume"):
-            d["time_consume"] = self.time_consume
-        if hasattr(self, "finish_at"):
-            d["finish_at"] = self.finish_at
-        if hasattr(self, "start_at"):
-            d["start_at"] = self.start_at
-        if hasattr(self, "resource"):
-            d["resource"] = self.resource.__class__.__name__
-        if hasattr(self, "input"):
+        r = self._record if self._record is not None else _EMPTY
+        for k in ["time_consume", "finish_at", "start_at", "returncode"]:
+            if getattr(r, k) is not _UNSET:
+                d[k] = getattr(r, k)
+        if r.returncode is not _UNSET:
+            d["status"] = _status(self)
+        for k in ["attempts", "cached"]:
+            if getattr(r, k) is not _UNSET:
+                d[k] = getattr(r, k)
+        if self.revision is not None:
+            d["revision"] = self.revision
+        if r.worktree is not _UNSET:
+            d["worktree"] = str(r.worktree)
+        if r.cuda_visible_devices is not _UNSET:
+            d["cuda_visible_devices"] = r.cuda_visible_devices
+        if self.requires is not None:
+            d["requires"] = self.requires
+        if self.after is not None:
+            d["after"] = [x.name if isinstance(x, Run) else str(x) for x in self.after]
+        if r.skipped is not _UNSET:
+            d["skipped"] = r.skipped
+        if self.sweep_id is not None:
+            d["sweep_id"] = self.sweep_id
+            d["params"] = self.params
+        for k in ["usage", "node"]:
+            if getattr(r, k) is not _UNSET:
+                d[k] = getattr(r, k)
+        if r.stdout is not _UNSET:
+            d["stdout"] = r.stdout
+            d["stderr"] = r.stderr
+        d["resource"] = self.resource.__class__.__name__
+        if self.input is not None:
             d["input"] = str(self.input)
+        if r.result is not _UNSET:
+            d["result"] = r.result
+        if r.staged is not _UNSET:
+            d["staged"] = r.staged
 
         return d
 
 
+_EMPTY = Record()
+
+
+@dataclass(**_slots)
+class PyRun(Run):
+    """A run of a Python function in a pre-forked worker of the `Pool`, not in a new interpreter.
+
+    Args:
+        target (str): "package.module:function", a module to run as `python -m module args...`,
+            or a function which can be imported by its module. nessary
+        args (list): The positional arguments, or the command line arguments of a module. not nessary
+        kwargs (dict): The keyword arguments. not nessary
+
+    The command is made from them, for the summary and the cache. The return value of the
+    function is the `result` in the summary, an exception or `sys.exit(1)` fails the run.
+    """
+
+    command: str = None
+    target: object = None
+    args: list = None
+    kwargs: dict = None
+
+    def __post_init__(self):
+        assert self.target is not None, "PyRun needs a target."
+        if self.command is None:
+            if callable(self.target):
+                target = f"{self.target.__module__}:{self.target.__qualname__}"
+            else:
+                target = self.target
+            if ":" in target:
+                params = [repr(x) for x in self.args or []] + [f"{k}={v!r}" for k, v in (self.kwargs or {}).items()]
+                self.command = f"{target}({', '.join(params)})"
+            else:
+                self.command = " ".join(["python -m", target, *[str(x) for x in self.args or []]])
+        Run.__post_init__(self)
+
+
 class Experiment:
     """
     Is a container for Run class. Main function is "launch" the Runs.
     """
 
-    summary_lock = threading.Lock()  # Use this to synchronize summary file writing
+    summary_path = "summary.json"
+    usage_path = "usage.json"  # the usage of the runs of the last launch, summed
+    journal_path = "summary.jsonl"  # the summary file is built from it at the end of launch
 
     # ===== For human =====
     # The title for this experiment.
@@ -113,7 +331,45 @@ class Experiment:
     # The argparse args for experiments.
     args: list = None
     # a pipe to recv task from producer and consume the task to worker.
-    runs: list
+    dispatcher: Dispatcher
+    # skip the runs finished before, None to run everything.
+    cache: Cache = None
+    # the git worktrees for the runs with a revision.
+    worktrees: Worktrees = None
+    # the GPUs and the counted resources (cpu, ram, licenses...) granted to the runs.
+    cudas: CUDAs
+    counted: CountedResources
+    # capture the output of each run into its files, None to write to the console directly.
+    logs: Logs = None
+    # the dependencies between the runs, a run goes to the dispatcher when it is ready.
+    graph: Graph
+    # all the runs are in the graph, the dispatcher is closed when the graph is empty.
+    fed: bool = False
+    # the defaults of `Run.timeout` and `Run.retries`, the first retry waits `backoff` seconds,
+    # then twice longer each time. fail_fast: skip the rest of a sequence after a failed run.
+    timeout: float = None
+    retries: int = 0
+    backoff: float = 10.0
+    fail_fast: bool = False
+    # the number of runs at the same time on this node, by its load. None if not adaptive.
+    controller: Controller = None
+    # the peak memory timeline of each run, None if `sample_memory` is off.
+    sampler: usage.Sampler = None
+    # the `hypo agent`s on the other nodes, and the number of workers on this node.
+    agents: list = None
+    local_workers: int = 0
+    # run the short commands in a persistent shell per worker, instead of a new process each.
+    batch: bool = False
+    # the pre-forked Python workers of the `PyRun`s.
+    pool: Pool = None
+    # the live counters for `hypo status`, None out of a launch.
+    status: Status = None
+    # the durations of the former runs, for `order="longest"`. None for the list order.
+    history: History = None
+    # the lifecycle of the runs in SQLite, for `hypo resume` and `hypo ls`. None if off.
+    state: State = None
+    # the copies of the datasets on the local disk, None to read them from their path.
+    staging: Staging = None
 
     def __init__(self, args: list = None) -> None:
 
@@ -123,6 +379,330 @@ class Experiment:
         if hasattr(self, "env"):
             os.environ.update(self.env)
 
+    def sequence(self, running_candidate) -> list:
+        """Log the launch. A single run is a sequence of one run."""
+        if isinstance(running_candidate, list):
+            s = "\n".join([pprint.pformat(x.asdict()) for x in running_candidate])
+            logger.info(f"[LAUNCH Sequence]\n{s}")
+            return running_candidate
+
+        elif isinstance(running_candidate, Run):
+            logger.info(f"[LAUNCH]\n{pprint.pformat(running_candidate.asdict())}")
+            return [running_candidate]
+        else:
+            raise Exception("Running should be list[Run] or Run.")
+
+    def gpu_need(self, running_candidate: list) -> dict:
+        """What a sequence needs from `CUDAs`, the most of its runs, as it holds the GPUs until it is done.
+
+        A run without `gpus` needs one GPU (none on a CPU only machine), a run without `gpu_share`
+        one slot, they count in the most too.
+        """
+        gpus = _most(x.gpus for x in running_candidate)
+        if (gpus or 0) < 1 and any(x.gpus is None for x in running_candidate):
+            gpus = None  # the default of `CUDAs`
+        return {
+            "gpus": gpus,
+            "memory": _most(x.gpu_memory for x in running_candidate),
+            "share": _most(x.gpu_share for x in running_candidate),
+            "slot": any(x.gpu_share is None for x in running_candidate),
+        }
+
+    def counted_need(self, running_candidate: list) -> dict:
+        """What a sequence needs from `CountedResources`, the most of its runs for each resource."""
+        keys = {k for x in running_candidate for k in (x.requires or {})}
+        return {k: _most((x.requires or {}).get(k) for x in running_candidate) for k in keys}
+
+    def nodes(self) -> list:
+        """This node if it has workers (or there is no agent), and the agents."""
+        return ([self] if self.local_workers > 0 or not self.agents else []) + (self.agents or [])
+
+    def check(self, running_candidate):
+        """Raise if the run sequence could never be granted its resources, on any node."""
+        running_candidate = _as_sequence(running_candidate)
+        errors = []
+        for node in self.nodes():
+            try:
+                node.counted.check(self.counted_need(running_candidate))
+                node.cudas.check(**self.gpu_need(running_candidate))
+                return
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def try_acquire(self, running_candidate, node=None):
+        """Grant all the resources of the run sequence at once, or None and take nothing.
+
+        Args:
+            node (Agent): Grant the resources of this agent, instead of this node.
+        """
+        if node is not None and not node.alive:
+            return None
+        key = id(running_candidate)
+        running_candidate = _as_sequence(running_candidate)
+        if node is not None and any(isinstance(x, PyRun) for x in running_candidate):
+            return None  # the pool is on this node
+        resources = node or self
+        counted = self.counted_need(running_candidate)
+        if not resources.counted.try_acquire(counted):
+            return None
+        cudas = resources.cudas.try_acquire(**self.gpu_need(running_candidate))
+        if cudas is None:
+            resources.counted.release(counted)
+            return None
+        if node is None and self.controller is not None and not self.controller.try_take():
+            resources.cudas.release(cudas)
+            resources.counted.release(counted)
+            return None
+        grant = Grant(cudas, counted, node)
+        if self.status is not None:
+            self.status.granted(grant)
+        if self.history is not None:
+            self.dispatched.append(key)
+        return grant
+
+    def release(self, grant: Grant):
+        if self.status is not None:
+            self.status.released(grant)
+        resources = grant.node or self
+        resources.cudas.release(grant.cudas)
+        resources.counted.release(grant.counted)
+        if grant.node is None and self.controller is not None:
+            self.controller.give()
+        self.dispatcher.wake()  # the runs waiting for these resources could go now
+
+    def make_env(self, cuda_visible_devices) -> dict:
+        """use env to control the using resouces & control the processing"""
+        env = os.environ.copy()
+        env["CUDA_VISIBLE_DEVICES"] = str(cuda_visible_devices)
+        return env
+
+    def workdir(self, running: Run) -> Path:
+        """The cwd for the process, in the worktree of `running.revision` if it is set."""
+        if running.revision is None:
+            return running.cwd
+        running.worktree = self.worktrees.acquire(running.cwd, running.revision)
+        return self.worktrees.relocate(running.cwd, running.worktree)
+
+    def stage(self, running: Run) -> dict:
+        """The environment variables of the datasets of the run: their local copy with `staging`,
+        staged if needed, or their path. Blocks while another run is staging the same dataset."""
+        if not running.datasets:
+            return {}
+        if self.staging is None:
+            return {k: str(v) for k, v in running.datasets.items()}
+        running.staged = {}
+        for k, source in running.datasets.items():
+            running.staged[k] = str(self.staging.acquire(source))
+        return dict(running.staged)
+
+    def leave(self, running: Run):
+        """The process of the run is done, release its worktree and its datasets."""
+        if getattr(running, "worktree", None) is not None:
+            self.worktrees.release(running.worktree)
+        if self.staging is not None:
+            for path in getattr(running, "staged", {}).values():
+                self.staging.release(path)
+
+    def open_logs(self, running: Run) -> Capture:
+        """The pipes for the stdout/stderr of the process, None to use the console."""
+        if self.logs is None:
+            return None
+        return self.logs.open(running)
+
+    def close_logs(self, running: Run, capture: Capture):
+        if capture is None:
+            return
+        self.logs.wait(capture)
+        running.stdout = str(capture.paths["stdout"])
+        running.stderr = str(capture.paths["stderr"])
+
+    def started(self, running: Run) -> float:
+        running.attempts = getattr(running, "attempts", 0) + 1
+        running.start_at = datetime.datetime.now().strftime(
+            "%Y-%m-%d__%H-%M-%S"
+        )
+        if self.status is not None:
+            self.status.started()
+        return time.time()
+
+    def finished(self, running: Run, start_time: float):
+        t = time.time() - start_time
+        if self.status is not None:
+            self.status.finished(t)
+        logger.info(f"[FINISH {t:.1f}s] {running.command}")
+        running.time_consume = str(datetime.timedelta(seconds=t))
+        running.finish_at = datetime.datetime.now().strftime(
+            "%Y-%m-%d__%H-%M-%S"
+        )
+        if hasattr(running, "usage"):
+            with self.usage_lock:
+                usage.add(self.usage, running.usage)
+        if self.cache is not None:
+            self.cache.put(running)
+
+    def track(self, running: Run, process):
+        """Sample the memory of the process tree, if `sample_memory` is on. Record its PID in the state."""
+        if self.sampler is not None:
+            self.sampler.track(process.pid)
+        if self.state is not None:
+            self.state.spawned(running, process.pid)
+
+    def untrack(self, running: Run, process):
+        if self.sampler is not None:
+            running.usage.update(self.sampler.untrack(process.pid))
+
+    def runnable(self, running: Run) -> bool:
+        """If the run should run now: not done by a former attempt of its sequence, nor skipped by the cache."""
+        if getattr(running, "attempts", 0) and getattr(running, "returncode", None) == 0:
+            return False
+        return not self.cached(running)
+
+    def stop_sequence(self, running_candidate: list, i: int) -> bool:
+        """With `fail_fast`, skip the runs after the i-th run of the sequence if it failed."""
+        if not self.fail_fast or _ok(running_candidate[i]):
+            return False
+        for running in running_candidate[i + 1 :]:
+            running.skipped = "a run before it in the sequence failed"
+        return True
+
+    def timeout_of(self, running: Run):
+        return running.timeout if running.timeout is not None else self.timeout
+
+    def cached(self, running: Run) -> bool:
+        """If the run can be skipped by the cache. Its record is copied from the cache."""
+        if self.cache is None:
+            return False
+        record = self.cache.skip(running)
+        if record is None:
+            return False
+        for k in ["start_at", "finish_at", "time_consume", "returncode"]:
+            if k in record:
+                setattr(running, k, record[k])
+        running.cached = True
+        logger.info(f"[CACHED] {running.command}")
+        return True
+
+    def execute(self, running: Run, env: dict):
+        """Run the process of one run, with the thread engine."""
+        if running.resource is not None:
+            running.resource.acquire()
+        capture = self.open_logs(running)
+        import subprocess
+
+        timeout = self.timeout_of(running)
+        try:
+            datasets = self.stage(running)
+            if datasets:
+                env = {**(env if env is not None else os.environ), **datasets}
+            process = subprocess.Popen(
+                running.command,
+                shell=True,
+                cwd=self.workdir(running),
+                env=env if env is not None else os.environ,
+                stdout=sys.stdout if capture is None else capture.stdout,
+                stderr=sys.stderr if capture is None else capture.stderr,
+                **deadline.popen_kwargs(timeout),
+            )
+            self.track(running, process)
+            timer = deadline.Deadline(process, timeout) if timeout else None
+            running.returncode, running.usage = usage.wait(process)
+            if timer is not None:
+                timer.cancel()
+                running.timed_out = timer.expired
+            self.untrack(running, process)
+            if running.returncode != 0:
+                print(subprocess.CalledProcessError(running.returncode, running.command))
+        except Exception as e:
+            running.returncode = getattr(e, "returncode", None)
+            print(e)
+        self.close_logs(running, capture)
+        self.leave(running)
+
+        if running.resource is not None:
+            running.resource.release()
+
+    def execute_in_shell(self, running: Run):
+        """Run one run in the persistent shell of this worker, with `batch`. No rusage, no timeout."""
+        if running.resource is not None:
+            running.resource.acquire()
+        shell = getattr(self.local, "shell", None)
+        if shell is None or not shell.alive:
+            from .shell import Shell
+
+            shell = self.local.shell = Shell()
+            with self.usage_lock:
+                self.shells.append(shell)
+        paths = {} if self.logs is None else self.logs.paths(running)
+        try:
+            env = {"CUDA_VISIBLE_DEVICES": running.cuda_visible_devices, **self.stage(running)}
+            running.returncode = shell.run(running.command, self.workdir(running), env, **paths)
+            if running.returncode is None:
+                print(f"The shell of the worker is gone, running: {running.command}")
+            elif running.returncode != 0:
+                print(f"Command '{running.command}' returned non-zero exit status {running.returncode}.")
+        except Exception as e:
+            running.returncode = None
+            print(e)
+        if paths:
+            running.stdout = str(paths["stdout"])
+            running.stderr = str(paths["stderr"])
+        self.leave(running)
+
+        if running.resource is not None:
+            running.resource.release()
+
+    def execute_call(self, running: PyRun):
+        """Run a `PyRun` in a worker of the pool."""
+        if running.resource is not None:
+            running.resource.acquire()
+        paths = {} if self.logs is None else self.logs.paths(running)
+        try:
+            env = self.stage(running)
+            self.pool.execute(running, self.workdir(running), self.timeout_of(running), env=env, **paths)
+            if running.returncode != 0:
+                print(f"{running.command} returned non-zero exit status {running.returncode}.")
+        except Exception as e:
+            running.returncode = None
+            print(e)
+        if paths:
+            running.stdout = str(paths["stdout"])
+            running.stderr = str(paths["stderr"])
+        self.leave(running)
+
+        if running.resource is not None:
+            running.resource.release()
+
+    def run_sequence(self, running_candidate, grant: Grant):
+        running_candidate = self.sequence(running_candidate)
+        env = None  # made for the first run which needs it, the batched ones do not
+        if grant.node is not None:  # set over the environment of the agent
+            env = {**getattr(self, "env", {}), "CUDA_VISIBLE_DEVICES": str(grant.cudas)}
+
+        # <launch>
+        for i, running in enumerate(running_candidate):
+            running: Run
+            if not self.runnable(running):
+                continue
+            running.cuda_visible_devices = str(grant.cudas)
+            start_time = self.started(running)
+            if self.state is not None:
+                self.state.running(running, grant.node)
+            if grant.node is not None:
+                grant.node.execute(running, env, self.timeout_of(running))
+            elif isinstance(running, PyRun):
+                self.execute_call(running)
+            elif self.batch and not self.timeout_of(running):
+                self.execute_in_shell(running)
+            else:
+                env = env or self.make_env(grant.cudas)
+                self.execute(running, env)
+            self.finished(running, start_time)
+            if self.stop_sequence(running_candidate, i):
+                break
+        # </launch>
+
     def worker(self):
         """
         A threading safe method. The launch is not threading safe.
@@ -130,135 +710,464 @@ class Experiment:
         """
 
         while True:
-            running_candidate: Run = self.runs.pop(0)
-            if running_candidate is None:  # Check for the end signal
-                self.runs.append(None)  # Propagate the end signal for other workers
+            try:
+                # <resource-control> the most urgent run which all its resources are free
+                running_candidate, grant = self.dispatcher.get(acquire=self.try_acquire)
+            except Closed:  # closed and drained, no more runs
                 break
 
-            if isinstance(running_candidate, list):
-                s = "\n".join([pprint.pformat(x.asdict()) for x in running_candidate])
-                logger.info(f"[LAUNCH Sequence]\n{s}")
+            try:
+                self.run_sequence(running_candidate, grant)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self.release(grant)
+                self.complete(running_candidate)
 
-            elif isinstance(running_candidate, Run):
-                logger.info(f"[LAUNCH]\n{pprint.pformat(running_candidate.asdict())}")
-                running_candidate = [running_candidate]
-            else:
-                raise Exception("Running should be list[Run] or Run.")
-
-            # <resource-control> use env to control the using resouces & control the processing
-            env = os.environ.copy()
-            cuda_cuda_visible_devices = self.cudas.acquire()
-            env["CUDA_VISIBLE_DEVICES"] = str(cuda_cuda_visible_devices)
-
-            # <launch>
-            for running in running_candidate:
-                running: Run
-                start_time = time.time()
-                running.start_at = datetime.datetime.now().strftime(
-                    "%Y-%m-%d__%H-%M-%S"
-                )
-                if running.resource is not None:
-                    running.resource.acquire()
-                try:
-                    subprocess.run(
-                        running.command,
-                        shell=True,
-                        cwd=running.cwd,
-                        env=env if env is not None else os.environ,
-                        stdout=sys.stdout,
-                        stderr=sys.stderr,
-                        check=True,
-                    )
-                except Exception as e:
-                    print(e)
-
-                if running.resource is not None:
-                    running.resource.release()
-                # </launch>
-
-                t = time.time() - start_time
-                logger.info(f"[FINISH {t:.1f}s] {running.command}")
-                running.time_consume = str(datetime.timedelta(seconds=t))
-                running.finish_at = datetime.datetime.now().strftime(
-                    "%Y-%m-%d__%H-%M-%S"
-                )
-                self.cudas.release(cuda_cuda_visible_devices)
+    def remote_worker(self, agent):
+        """`worker` for a slot of an agent. The run sequence on a lost agent goes back to the queue,
+        and the slot waits for the agent to come back."""
+        from .agent import AgentLost
 
-            # Update the summary after every task
-            self.update_summary(running_candidate)
-            self.bar()
+        while True:
+            while not agent.alive:
+                if self.dispatcher.closed and len(self.dispatcher) == 0:
+                    return
+                time.sleep(1)
+                if agent.ping() is not None:
+                    logger.info(f"[AGENT] {agent.address} is back")
+                    self.dispatcher.wake()  # the other slots of the agent are waiting for a grant
+            try:
+                running_candidate, grant = self.dispatcher.get(acquire=lambda x: self.try_acquire(x, agent))
+            except Closed:
+                break
+
+            try:
+                self.run_sequence(running_candidate, grant)
+            except AgentLost as e:
+                agent.alive = False
+                logger.error(f"[AGENT LOST] {e}, re-queue {_as_sequence(running_candidate)[0].name}")
+                self.release(grant)
+                self.dispatcher.put(running_candidate, priority=self.priority(running_candidate), force=True)
+                continue
+            except Exception as e:
+                logger.exception(e)
+            self.release(grant)
+            self.complete(running_candidate)
 
     def update_summary(self, run):
-        """Updates the summary file with the latest run information."""
-        summary_path = "summary.json"
-
-        # Make sure to synchronize access to the summary file across threads
-        with self.summary_lock:
-            summary = []
-            if os.path.exists(summary_path):
-                with open(summary_path, "r") as f:
-                    summary = json.load(f)
-
-            # Check if `run` is a list of runs or a single run instance
-            if isinstance(run, list):
-                sub_summary = []
-                for single_run in run:
-                    sub_summary.append(single_run.asdict())
-                summary.append(sub_summary)
+        """Appends the latest run information to the journal."""
+        # Check if `run` is a list of runs or a single run instance
+        if isinstance(run, list):
+            record = [single_run.asdict() for single_run in run]
+        else:
+            # If it's a single Run object
+            record = run.asdict()
 
-            else:
-                # If it's a single Run object
-                summary.append(run.asdict())
-
-            # Write the updated summary back to the file
-            with open(summary_path, "w") as f:
-                json.dump(summary, f, indent=4, ensure_ascii=False)
-                logger.info(
-                    f"Updated the summary with {run if isinstance(run, list) else run.name} into {summary_path}"
-                )
+        self.journal.append(record)
+        logger.info(
+            f"Updated the summary with {run if isinstance(run, list) else run.name} into {self.journal_path}"
+        )
+
+    def priority(self, running_candidate):
+        """The user priority first, then the longest critical path first."""
+        rank = self.graph.rank.get(id(running_candidate))
+        if rank is None:  # streamed, or not declared
+            rank = self.history.sequence(running_candidate) if self.history is not None else 0
+        return (_priority(running_candidate), -rank)
+
+    def compare_order(self, slots: int):
+        """Log the makespan of the dispatch order against the list order, by the observed durations.
 
-    def launch(self, runs: list, cuda_visible_devices=None, max_workers=None):
+        The dependencies and the resources are not simulated, only `slots` workers.
         """
-        Run the experiments in parallel using processes.
+        observed = self.observed
+        first = dict.fromkeys(x for x in self.dispatched if x in observed)  # a retry is dispatched again
+        fifo = makespan([observed[x] for x in self.fed_order if x in observed], slots)
+        ordered = makespan([observed[x] for x in first], slots)
+        logger.info(
+            f"[ORDER longest] makespan {ordered:.1f}s, the list order would take {fifo:.1f}s "
+            f"({fifo - ordered:+.1f}s), simulated with the observed durations on {slots} workers"
+        )
+
+    def retry(self, running_candidate) -> bool:
+        """If a run of the sequence failed and has attempts left, put the sequence back into the
+        queue after the backoff, without holding a worker meanwhile. Its done runs are not run again."""
+        seq = _as_sequence(running_candidate)
+        failed = next((x for x in seq if hasattr(x, "attempts") and not _ok(x) and not hasattr(x, "skipped")), None)
+        if failed is None:
+            return False
+        retries = failed.retries if failed.retries is not None else self.retries
+        if failed.attempts > retries:
+            return False
+        delay = self.backoff * 2 ** (failed.attempts - 1)
+        logger.warning(f"[RETRY {failed.attempts}/{retries} in {delay:g}s] {failed.name}: {_status(failed)}")
+        for running in seq:
+            if getattr(running, "skipped", None) == "a run before it in the sequence failed":
+                del running.skipped
+        timer = threading.Timer(
+            delay, self.dispatcher.put, (running_candidate,), {"priority": self.priority(running_candidate), "force": True}
+        )
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def complete(self, running_candidate):
+        """The run sequence has run: retry it, or record it and release the runs after it."""
+        if self.retry(running_candidate):
+            return
+        # Update the summary after every task
+        seq = _as_sequence(running_candidate)
+        self.update_summary(seq)
+        if self.state is not None:
+            self.state.finished(seq)
+        if self.history is not None:
+            self.observed[id(running_candidate)] = sum(seconds(x.time_consume) for x in seq if hasattr(x, "time_consume"))
+        skipped = sum(1 for x in seq if hasattr(x, "skipped"))
+        ok = sum(1 for x in seq if not hasattr(x, "skipped") and _ok(x))
+        self.status.recorded(ok=ok, failed=len(seq) - skipped - ok, skipped=skipped)
+        self.bar(len(seq))
+        self.done(running_candidate)
+
+    def skip(self, running_candidate, reason: str):
+        """Record a run sequence which will not run."""
+        running_candidate = _as_sequence(running_candidate)
+        for running in running_candidate:
+            running.skipped = reason
+            running.state = "failed"  # for the runs after it
+        logger.warning(f"[SKIP] {running_candidate[0].name}: {reason}")
+        self.update_summary(running_candidate)
+        if self.state is not None:
+            self.state.finished(running_candidate)
+        self.status.recorded(skipped=len(running_candidate))
+        self.bar(len(running_candidate))
+
+    def done(self, running_candidate):
+        """The run sequence is done, release the runs after it."""
+        ready, skipped = self.graph.finish(running_candidate)
+        for child in skipped:
+            self.skip(child, "a run it is after failed")
+        for child in ready:
+            self.dispatcher.put(child, priority=self.priority(child), force=True)
+        self.close_if_done()
+
+    def close_if_done(self):
+        """Close the dispatcher when all the runs are fed and done, the workers exit."""
+        if not self.fed:
+            return
+        for child in self.graph.stuck():
+            self.skip(child, "a run it is after never ran (a cycle, or not in the runs)")
+        if self.graph.active == 0:
+            self.dispatcher.close()
+
+    def feed(self, runs):
+        """Put the ready runs into the dispatcher. Blocks while the dispatcher is full."""
+        try:
+            for running_candidate in runs:
+                try:
+                    for running in _as_sequence(running_candidate):
+                        running.resolve(self.paths)
+                    self.check(running_candidate)
+                    state = self.graph.add(running_candidate)
+                except Exception as e:  # it cannot run here, recorded like the other skipped runs
+                    if self.state is not None:
+                        self.state.queued(running_candidate)
+                    self.skip(running_candidate, str(e))
+                    continue
+                if self.history is not None:
+                    self.fed_order.append(id(running_candidate))
+                if self.state is not None:
+                    self.state.queued(running_candidate)
+                if state == "ready":
+                    self.dispatcher.put(running_candidate, priority=self.priority(running_candidate))
+                elif state == "skipped":
+                    self.skip(running_candidate, "a run it is after failed")
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self.fed = True
+            self.close_if_done()
+
+    def launch(
+        self,
+        runs: list,
+        cuda_visible_devices=None,
+        max_workers=None,
+        buffer=None,
+        engine="thread",
+        cache=None,
+        gpu_provider: GPUProvider = None,
+        resources: dict = None,
+        logs="tail",
+        agents: list = None,
+        sample_memory: float = None,
+        timeout: float = None,
+        retries: int = 0,
+        backoff: float = 10.0,
+        fail_fast: bool = False,
+        adaptive: bool = False,
+        min_workers: int = 1,
+        batch: bool = False,
+        pool: Pool = None,
+        status_path=".hypo/status.sock",
+        order="fifo",
+        state=None,
+        staging=None,
+    ):
         """
-        self.runs = runs
+        Run the experiments in parallel using processes.
+
+        The runs can be a list, or any iterable (e.g. a generator). An iterable is
+        consumed by a producer thread through a buffer of at most `buffer` runs
+        (2 * max_workers by default), so the workers start with the first yielded
+        runs while the generator is still preparing the rest.
+
+        engine "thread": one thread per worker, blocked in `subprocess.run`.
+        engine "async": all the processes are driven by one asyncio event loop,
+        `max_workers` only limits how many run at the same time. For many short commands.
+
+        cache: True or a `Cache`, to skip the runs finished successfully before.
+
+        gpu_provider: where the GPUs and their free memory come from, GPUtil by default.
 
-        assert isinstance(self.runs, list), "The runs should be list."
+        resources: the capacity of the counted resources for `Run.requires`, e.g. {"license": 2}.
+        "cpu" (cores) and "ram" (GB) of this machine are there by default.
 
+        logs "tail": the stdout/stderr of each run goes into its files under `Run.output/logs`,
+        and to the console prefixed by the run name, rate limited.
+        logs "file": only into the files. logs "console": directly to the console, not captured.
+
+        agents: the "host:port" of the `hypo agent`s on the other nodes. A run sequence goes to
+        this node or to an agent, wherever its resources are free. Only with the thread engine.
+
+        The usage of each run (CPU time, max RSS, block I/O, context switches) is in its record,
+        and the sum of this launch in `usage_path`. sample_memory: sample the memory of each
+        run every this number of seconds, for its peak memory timeline. Off by default.
+
+        timeout: kill all the processes of a run after this number of seconds, for the runs
+        without their own `Run.timeout`. The `status` in the summary is "timeout".
+        retries: run a failed run again this number of times, for the runs without their own
+        `Run.retries`. It goes back to the queue after `backoff` seconds, twice longer each time.
+        fail_fast: skip the rest of a run sequence after one of its runs failed.
+
+        max_workers: the number of GPUs by default, the number of CPU cores without GPUs.
+        adaptive: start `min_workers` runs at the same time, and adapt it up to `max_workers`
+        by the load average, the free memory and the pressure stall of this machine.
+
+        batch: each worker keeps a shell and sends it the commands over a pipe, instead of
+        starting a new process for each run. For many commands of less than 100ms. The runs
+        with a timeout still get their own process. Only with the thread engine, and without
+        the usage and the console tail of the batched runs.
+
+        pool: a `Pool`, for the workers of the `PyRun`s: the modules they preload and when they
+        are recycled. `max_workers` workers without preload by default. Not with the agents.
+
+        status_path: the Unix socket of the live state for `hypo status`: the number of the
+        queued, running, done and failed runs, the durations, the ETA and the use of the GPUs
+        and of the workers. None to not serve it.
+
+        order "fifo": the runs start in the list order (after `Run.priority` and the dependencies).
+        order "longest": the longest runs first, by `Run.duration` or the durations of the former
+        runs in the journal; with dependencies, the longest critical path first. At the end, the
+        makespan of this order and of the list order are compared with the observed durations.
+
+        state: True, a database path or a `State`, to record the lifecycle of every run in SQLite
+        (.hypo/state.db by default): queued, running with its PID and GPUs, finished with its exit
+        code. After the launch was killed, `hypo resume` runs again what it left queued or running,
+        and `hypo ls --failed --name 'sofa*'` queries the runs. Off by default.
+
+        staging: True or a `Staging`, to copy the `Run.datasets` once onto the local disk of this
+        node, and set their variables to the copies. The runs of an agent use its own staging.
+        """
+        from concurrent.futures import as_completed, ThreadPoolExecutor
+        from alive_progress import alive_bar
+        from .cache import Cache
+        from .worktree import Worktrees
+        from .logs import Logs
+
+        gpu_provider = gpu_provider or default_provider()
         if max_workers is None:
-            max_workers = len(GPUtil.getGPUs())
+            max_workers = len(gpu_provider.devices()) or os.cpu_count() or 1
 
         logger.info(f"max workers: {max_workers}")
         start = time.time()
-        self.cudas = CUDAs(cuda_visible_devices=cuda_visible_devices, max_workers=max_workers)
-        num = len(self.runs) - 1
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            with alive_bar(num, title="Hypo Progress") as bar:
-                self.bar = bar
-                futures = [executor.submit(self.worker) for _ in range(max_workers)]
-                for future in as_completed(futures):
+        self.local_workers = max_workers
+        self.agents = []
+        if agents:
+            from .agent import Agent, AgentLost
+
+            assert engine == "thread", "The agents only work with the thread engine."
+            for address in agents:
+                try:
+                    self.agents.append(Agent(address))
+                except AgentLost as e:
+                    logger.error(e)
+        slots = max_workers + sum(agent.max_workers for agent in self.agents)
+        self.cudas = CUDAs(cuda_visible_devices=cuda_visible_devices, max_workers=max_workers, provider=gpu_provider)
+        self.counted = CountedResources(resources)
+        journal.migrate(self.summary_path, self.journal_path)
+        self.journal = journal.Journal(self.journal_path)
+        if cache is True:
+            cache = Cache()
+        self.cache = cache or None
+        if self.cache is not None:
+            self.cache.evict()
+        self.worktrees = Worktrees()
+        if staging is True:
+            from .staging import Staging
+
+            staging = Staging()
+        self.staging = staging or None
+        self.sampler = None if sample_memory is None else usage.Sampler(interval=sample_memory)
+        self.usage = {}
+        self.usage_lock = threading.Lock()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.fail_fast = fail_fast
+        if batch and engine != "thread":
+            logger.warning("batch only works with the thread engine, ignored.")
+        self.batch = batch and engine == "thread"
+        self.local = threading.local()  # the shell of each worker
+        self.shells = []
+        self.pool = pool or Pool()
+        if self.pool.size is None:
+            self.pool.size = max(max_workers, 1)
+        self.logs = None if logs == "console" else Logs(tail=logs == "tail")
+        self.graph = Graph()
+        self.fed = False
+        assert order in ("fifo", "longest"), f"Unknown order {order}."
+        self.history = History(self.journal_path) if order == "longest" else None
+        self.fed_order, self.dispatched, self.observed = [], [], {}
+        self.paths = {}  # the cwd and output paths of the runs, as given -> absolute
+        if state is True or isinstance(state, str):
+            from .state import State
+
+            state = State(state if isinstance(state, str) else ".hypo/state.db")
+        self.state = state
+        if self.state is not None:
+            # the options `hypo resume` launches the runs left with, the objects are not kept
+            options = dict(
+                cuda_visible_devices=cuda_visible_devices, max_workers=max_workers, buffer=buffer, engine=engine,
+                cache=bool(cache), resources=resources, logs=logs, agents=agents, sample_memory=sample_memory,
+                timeout=timeout, retries=retries, backoff=backoff, fail_fast=fail_fast, adaptive=adaptive,
+                min_workers=min_workers, batch=batch, status_path=status_path, order=order,
+                staging=None if self.staging is None else self.staging.options(),
+                summary_path=self.summary_path, usage_path=self.usage_path, journal_path=self.journal_path,
+            )
+            self.state.start(options)
+        # the number of runs, unknown until the generator is exhausted
+        total = sum(len(_as_sequence(x)) for x in runs) if isinstance(runs, list) else None
+        self.status = Status(total=total, slots=slots, cudas=self.cudas)
+        if status_path is not None:
+            self.status.serve(status_path)
+        with alive_bar(total, title="Hypo Progress") as bar:
+            self.bar = bar
+            if isinstance(runs, list):
+                if self.history is not None:
+                    self.graph.declare(runs, weight=self.history.sequence)
+                elif any(x.after or x.produces for item in runs for x in _as_sequence(item)):
+                    self.graph.declare(runs)
+                self.dispatcher = Dispatcher()
+                self.status.dispatcher = self.dispatcher
+                self.feed(runs)
+            else:
+                self.dispatcher = Dispatcher(maxsize=buffer or 2 * slots)
+                self.status.dispatcher = self.dispatcher
+                producer = threading.Thread(target=self.feed, args=(runs,), name="hypo-producer", daemon=True)
+                producer.start()
+
+            self.controller = None
+            if adaptive and max_workers > 0:
+                self.controller = Controller(
+                    min(min_workers, max_workers),
+                    max_workers,
+                    queued=lambda: len(self.dispatcher),
+                    wake=self.dispatcher.wake,
+                )
+
+            if engine == "async":
+                import asyncio
+                from .aio import serve
+
+                try:
+                    asyncio.run(serve(self, max_workers))
+                except KeyboardInterrupt:
+                    deadline.interrupt()  # the runs in their own process group did not get it
+                    raise
+            else:
+                with ThreadPoolExecutor(max_workers=max(slots, 1)) as executor:
+                    futures = [executor.submit(self.worker) for _ in range(max_workers)]
+                    futures += [
+                        executor.submit(self.remote_worker, agent) for agent in self.agents for _ in range(agent.max_workers)
+                    ]
                     try:
-                        future.result()
-                    except Exception as e:
-                        logger.exception(e)
+                        for future in as_completed(futures):
+                            try:
+                                future.result()
+                            except Exception as e:
+                                logger.exception(e)
+                    except KeyboardInterrupt:
+                        deadline.interrupt()  # or the workers wait for them forever
+                        raise
 
+        for shell in self.shells:
+            shell.close()
+        self.pool.close()
+        self.status.close()
+        if self.state is not None:
+            self.state.close()
+        if self.logs is not None:
+            self.logs.close()
+        if self.sampler is not None:
+            self.sampler.close()
+        if self.controller is not None:
+            self.controller.close()
+        self.journal.close()
+        journal.build_summary(self.journal_path, self.summary_path)
+        with open(self.usage_path, "w", encoding="utf-8") as f:
+            json.dump(self.usage, f, indent=2)
+        logger.info(f"Usage of the runs: {self.usage}")
+        if self.history is not None:
+            self.compare_order(slots)
         time_consume = f"{time.time() - start:.2f}"
         logger.info(f"All tasks done, used {time_consume}s")
 
 
+def _most(values):
+    values = [x for x in values if x is not None]
+    return max(values) if values else None
+
+
+def _status(running) -> str:
+    """"ok", "failed" (exit code), "killed" (by a signal), "timeout", or "error" (could not start)."""
+    if getattr(running, "timed_out", False):
+        return "timeout"
+    if running.returncode is None:
+        return "error"
+    if running.returncode == 0:
+        return "ok"
+    return "killed" if running.returncode < 0 else "failed"
+
 
-def run(cuda_visible_devices=None, max_workers=None):
-    """Decorator. Run the experiments list"""
+def _priority(running_candidate) -> int:
+    """The priority of a sequence is the most urgent one in it."""
+    if isinstance(running_candidate, list):
+        return min((x.priority for x in running_candidate), default=0)
+    return running_candidate.priority
+
+
+def run(cuda_visible_devices=None, max_workers=None, **kwargs):
+    """Decorator. Run the experiments list. The other kwargs are passed to `Experiment.launch`."""
 
     def inner(func):
         exp = Experiment()
 
-        def wrapper(*args, **kwargs):
-            result: list = func(*args, **kwargs)
+        def wrapper(*args, **kw):
+            result: list = func(*args, **kw)
             assert isinstance(result, list), "The result should be list."
             # assert all([isinstance(x, Run) for x in result]), "The result should be list of Run."
-            result.append(None)
-            exp.launch(result, cuda_visible_devices=cuda_visible_devices, max_workers=max_workers)
+            exp.launch(result, cuda_visible_devices=cuda_visible_devices, max_workers=max_workers, **kwargs)
             return result
 
         return wrapper
@@ -266,30 +1175,18 @@ def run(cuda_visible_devices=None, max_workers=None):
     return inner
 
 
-def runs(cuda_visible_devices=None, max_workers=None):
-    """Decorator. Run the experiments yield"""
+def runs(cuda_visible_devices=None, max_workers=None, **kwargs):
+    """Decorator. Run the experiments yield. The other kwargs are passed to `Experiment.launch`.
+
+    The yielded runs are streamed to the workers as soon as they are ready,
+    at most `buffer` of them wait in memory at the same time.
+    """
 
     def inner(func):
-        def wrapper(*args, **kwargs):
+        def wrapper(*args, **kw):
             exp = Experiment()
-            q = []  # maybe a queue
-
-            # run in seperate process
-            def processing():
-                gen = func(*args, **kwargs)  # Get the generator
-                for value in gen:
-                    # logger.info(f"Put into queue: {value}")
-                    q.append(value)  # Put each value into the queue
-
-                # need None to say stop
-                q.append(None)
-
-            process = Process(target=processing)
-            process.start()
-            # process.join()  # donot join here, no need for waiting for the processing() done
-
-            # Process all items in the queue
-            exp.launch(q, cuda_visible_devices=cuda_visible_devices, max_workers=max_workers)
+            gen = func(*args, **kw)  # Get the generator
+            exp.launch(gen, cuda_visible_devices=cuda_visible_devices, max_workers=max_workers, **kwargs)
 
         return wrapper
 
@@ -0,0 +1,58 @@
+import heapq
+from statistics import median
+from .dag import _as_sequence
+
+
+def seconds(time_consume: str) -> float:
+    """The seconds of a `Run.time_consume`, e.g. "1 day, 2:03:04.5" or "0:00:12.25"."""
+    days = 0
+    if "day" in time_consume:
+        d, time_consume = time_consume.split(",")
+        days = int(d.split()[0])
+    h, m, s = time_consume.strip().split(":")
+    return days * 86400 + int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def makespan(durations: list, slots: int) -> float:
+    """The end of the last run, when the runs start in this order on the first free of `slots` workers."""
+    free = [0.0] * max(slots, 1)
+    for d in durations:
+        heapq.heapreplace(free, free[0] + d)
+    return max(free)
+
+
+class History:
+    """The durations of the runs finished before, from the journal, to estimate the next ones.
+
+    A run is estimated by its `duration` hint, then by the median of the former runs of the
+    same command, then of the same name. A run never seen takes the median of all of them.
+
+    Args:
+        journal_path (str): The journal of the former launches.
+    """
+
+    def __init__(self, journal_path="summary.jsonl") -> None:
+        from .journal import read
+
+        by_command, by_name = {}, {}
+        for record in read(journal_path):
+            for r in _as_sequence(record):
+                if r.get("returncode") != 0 or "time_consume" not in r or r.get("cached"):
+                    continue
+                t = seconds(r["time_consume"])
+                by_command.setdefault(r["command"], []).append(t)
+                by_name.setdefault(r["name"], []).append(t)
+        self.by_command = {k: median(v) for k, v in by_command.items()}
+        self.by_name = {k: median(v) for k, v in by_name.items()}
+        self.default = median(self.by_command.values()) if self.by_command else 0.0
+
+    def estimate(self, running) -> float:
+        if running.duration is not None:
+            return running.duration
+        if running.command in self.by_command:
+            return self.by_command[running.command]
+        return self.by_name.get(running.name, self.default)
+
+    def sequence(self, running_candidate) -> float:
+        """The estimated seconds of a run sequence, its runs one after another."""
+        return sum(self.estimate(x) for x in _as_sequence(running_candidate))
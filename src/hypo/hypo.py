@@ -1,13 +1,53 @@
 import os
 import sys
 
-# if do not have this line, Python will not add the cwd path to the Python Path.
-sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '.')))
 
-def main():
+def main(argv: list = None):
     import importlib
-    from .experiment import Experiment
-    from .cfg import args, subargs
+    from .cfg import parse
+
+    args, subargs = parse(argv)
+
+    # if do not have this line, Python will not add the cwd path to the Python Path.
+    sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '.')))
+
+    if args.method == "summary":
+        # `hypo summary`: build the summary.json from the run journal
+        from .journal import build_summary
+
+        build_summary()
+        return
+
+    if args.method == "status":
+        # `hypo status`: the live state of the launch in this folder
+        from .status import main as status_main
+
+        return status_main(subargs)
+
+    if args.method == "ls":
+        # `hypo ls --failed --name 'sofa*'`: the runs recorded in the state database
+        from .state import ls
+
+        return ls(subargs)
+
+    if args.method == "resume":
+        # `hypo resume`: run again what a killed launch left queued or running
+        from .state import resume
+
+        return resume(subargs)
+
+    if args.method == "agent":
+        # `hypo agent --port 7777`: run the runs a coordinator dispatches to this node
+        from .agent import main as agent_main
+
+        agent_main(subargs)
+        return
+
+    # the cache mode for the runs in this process, see `hypo.cache.Cache`
+    if args.force:
+        os.environ["HYPO_CACHE"] = "force"
+    elif args.only_failed:
+        os.environ["HYPO_CACHE"] = "only-failed"
 
     # load the index file of the theorm. The index file contains the Experiment class.
     module = importlib.import_module(args.load_module)
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from .log import logger
+
+
+class Journal:
+    """An append-only journal of the finished runs, one JSON record per line.
+
+    A record is written with a single append and flushed to the OS at once, the file is
+    fsynced every `sync_every` records or `sync_interval` seconds. A crash loses at most
+    the records since the last fsync, and never the ones before it.
+
+    Args:
+        path (str): The journal file.
+        sync_every (int): fsync after this many records.
+        sync_interval (float): fsync if the last one is older than this, in seconds.
+    """
+
+    def __init__(self, path="summary.jsonl", sync_every=64, sync_interval=1.0) -> None:
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.synced_at = time.time()
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":  # a torn last line, the next record starts on its own line
+                    self.file.write("\n")
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or time.time() - self.synced_at >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.time()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            self._sync()
+            self.file.close()
+
+
+def read(path="summary.jsonl") -> list:
+    """Read all the records of a journal. A torn last line (killed mid-write) is skipped."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skip the broken record at {path}:{i + 1}")
+    return records
+
+
+def build_summary(journal_path="summary.jsonl", summary_path="summary.json") -> list:
+    """Build the summary file from the journal. The file is replaced atomically."""
+    summary = read(journal_path)
+    tmp_path = summary_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, summary_path)
+    logger.info(f"Built the summary with {len(summary)} records into {summary_path}")
+    return summary
+
+
+def migrate(summary_path="summary.json", journal_path="summary.jsonl"):
+    """Seed a new journal with the records of a summary file written by an old version."""
+    if os.path.exists(journal_path) or not os.path.exists(summary_path):
+        return
+    with open(summary_path, "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    with open(journal_path, "w", encoding="utf-8") as f:
+        for record in summary:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    logger.info(f"Migrated {len(summary)} records from {summary_path} into {journal_path}")
@@ -0,0 +1,11 @@
+class _Logger:
+    """The loguru logger, imported on the first log: loguru imports asyncio and multiprocessing,
+    which is most of the time of `import hypo`."""
+
+    def __getattr__(self, name):
+        from loguru import logger
+
+        return getattr(logger, name)
+
+
+logger = _Logger()
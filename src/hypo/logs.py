@@ -0,0 +1,207 @@
+import os
+import queue
+import re
+import selectors
+import sys
+import threading
+import time
+from pathlib import Path
+from .log import logger
+
+
+class Capture:
+    """The stdout/stderr of one run: the pipes to give to its process, and its log files."""
+
+    def __init__(self, name: str, folder: Path, label: str) -> None:
+        self.name = name
+        folder.mkdir(parents=True, exist_ok=True)
+        self.paths = {"stdout": folder / f"{label}.stdout.log", "stderr": folder / f"{label}.stderr.log"}
+        self.files = {k: open(p, "wb") for k, p in self.paths.items()}
+        self.partial = {"stdout": b"", "stderr": b""}  # the last line not ended yet, for the tail
+        self.pipes = {}  # stream -> read end, until it is closed
+        self.stdout, self.pipes["stdout"] = self._pipe()
+        self.stderr, self.pipes["stderr"] = self._pipe()
+        self.open_pipes = 2
+        self.done = threading.Event()
+        self.abandoned = False
+
+    @staticmethod
+    def _pipe():
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        return w, r
+
+    def close_child_ends(self):
+        """The process has started (and inherited them), the parent must not keep the write ends."""
+        for fd in [self.stdout, self.stderr]:
+            try:
+                os.close(fd)
+            except OSError:  # closed already
+                pass
+
+
+class Logs:
+    """Capture the stdout/stderr of each run into its own files under `Run.output/logs`.
+
+    The pipes of all the runs are drained by one thread with non-blocking reads, so a run
+    never waits for the terminal. With `tail`, the lines also go to the console prefixed
+    by the run name, at most `rate` lines per second, the others are counted and skipped.
+
+    Args:
+        tail (bool): Show the lines on the console.
+        rate (float): The max number of lines per second on the console.
+    """
+
+    def __init__(self, tail=True, rate=50) -> None:
+        self.tail = tail
+        self.rate = rate
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.pending = []  # the captures to register by the reader thread
+        self.counter = 0
+        self.stopped = False
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+        self.tokens = float(rate)
+        self.refilled_at = time.time()
+        self.skipped = 0
+        self.console = queue.Queue(maxsize=1000)
+
+        self.reader = threading.Thread(target=self._read, name="hypo-logs", daemon=True)
+        self.reader.start()
+        if tail:
+            self.printer = threading.Thread(target=self._print, name="hypo-tail", daemon=True)
+            self.printer.start()
+
+    def _label(self, running) -> str:
+        name = re.sub(r"[^\w.-]+", "_", running.name)
+        with self.lock:
+            self.counter += 1
+            return f"{name}-{running.start_at}-{self.counter}"
+
+    def open(self, running) -> Capture:
+        """The capture for a run, give `capture.stdout` and `capture.stderr` to its process."""
+        capture = Capture(running.name, Path(running.output) / "logs", self._label(running))
+        with self.lock:
+            self.pending.append(capture)
+        os.write(self.wake_w, b"x")
+        return capture
+
+    def paths(self, running) -> dict:
+        """The log files of a run which writes into them itself, not captured nor tailed."""
+        folder = Path(running.output) / "logs"
+        folder.mkdir(parents=True, exist_ok=True)
+        label = self._label(running)
+        return {"stdout": folder / f"{label}.stdout.log", "stderr": folder / f"{label}.stderr.log"}
+
+    def wait(self, capture: Capture, timeout=2):
+        """Wait until the output of the finished process is drained, then close the files."""
+        capture.close_child_ends()
+        if not capture.done.wait(timeout):  # e.g. a daemon started by the run keeps the pipe
+            logger.warning(f"The output of {capture.name} is still open after it finished, stop capturing it.")
+            capture.abandoned = True
+            with self.lock:
+                self.pending.append(capture)  # unregistered by the reader thread
+            os.write(self.wake_w, b"x")
+            capture.done.wait()
+        for f in capture.files.values():
+            f.close()
+
+    def close(self):
+        self.stopped = True
+        os.write(self.wake_w, b"q")
+        self.reader.join()
+        if self.tail:
+            if self.skipped:
+                self._skipped()
+            self.console.put(None)
+            self.printer.join()
+        os.close(self.wake_r)
+        os.close(self.wake_w)
+
+    def _read(self):
+        # all the captures are done when it is stopped, only the wake pipe is left
+        while not (self.stopped and len(self.selector.get_map()) == 1):
+            events = self.selector.select(timeout=1)
+            if not events and self.skipped:  # quiet now, tell how many lines were not shown
+                self._skipped()
+            for key, _ in events:
+                if key.fileobj == self.wake_r:
+                    self._register()
+                    continue
+                capture, stream = key.data
+                try:
+                    data = os.read(key.fileobj, 65536)
+                except BlockingIOError:
+                    continue
+                if data:
+                    capture.files[stream].write(data)
+                    if self.tail:
+                        self._tail(capture, stream, data)
+                else:
+                    self._unregister(capture, stream)
+
+    def _register(self):
+        try:
+            while os.read(self.wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for capture in pending:
+            for stream, fd in list(capture.pipes.items()):
+                if capture.abandoned:
+                    self._unregister(capture, stream)
+                elif fd not in self.selector.get_map():
+                    self.selector.register(fd, selectors.EVENT_READ, (capture, stream))
+
+    def _unregister(self, capture: Capture, stream: str):
+        fd = capture.pipes.pop(stream)
+        if fd in self.selector.get_map():
+            self.selector.unregister(fd)
+        os.close(fd)
+        if self.tail and capture.partial[stream]:
+            self._line(capture.name, capture.partial[stream])
+            capture.partial[stream] = b""
+        capture.open_pipes -= 1
+        if capture.open_pipes == 0:
+            capture.done.set()
+
+    def _tail(self, capture: Capture, stream: str, data: bytes):
+        lines = re.split(rb"[\r\n]", capture.partial[stream] + data)
+        capture.partial[stream] = lines.pop()
+        for line in lines:
+            if line:
+                self._line(capture.name, line)
+
+    def _line(self, name: str, line: bytes):
+        now = time.time()
+        self.tokens = min(self.rate, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if self.tokens < 1:
+            self.skipped += 1
+            return
+        self.tokens -= 1
+        if self.skipped:
+            self._skipped()
+        try:
+            self.console.put_nowait(f"[{name}] {line.decode(errors='replace')}")
+        except queue.Full:  # the terminal is slower than the runs
+            self.skipped += 1
+
+    def _skipped(self):
+        try:
+            self.console.put_nowait(f"[hypo] {self.skipped} lines not shown, see the log files")
+            self.skipped = 0
+        except queue.Full:
+            pass
+
+    def _print(self):
+        while True:
+            text = self.console.get()
+            if text is None:
+                break
+            print(text, file=sys.stdout, flush=True)
@@ -1,29 +1,95 @@
-import pandas as pd
+import json
 import os
-from filelock import Timeout, FileLock
+import socket
+import threading
+from glob import glob
+
+from .journal import read
+
+_segments = {}  # output -> (pid, file), the open segment of this process
+_segments_lock = threading.Lock()
+
+
+def _segment_dir(output):
+    return output + ".d"
+
+
+def _segment(output):
+    """The segment file of this process. Each process appends only to its own one, so no lock between processes."""
+    pid = os.getpid()
+    pid_file = _segments.get(output)
+    if pid_file is None or pid_file[0] != pid:  # not opened yet, or inherited by a forked child
+        os.makedirs(_segment_dir(output), exist_ok=True)
+        path = os.path.join(_segment_dir(output), f"{socket.gethostname()}-{pid}.jsonl")
+        pid_file = (pid, open(path, "a", encoding="utf-8"))
+        _segments[output] = pid_file
+    return pid_file[1]
 
 
 def save(parameters, metrics, output):
-    lock_file = output + ".lock"
+    """Append one row of parameters and metrics.
 
+    The row is a JSON line appended to a segment file of this process under `<output>.d/`,
+    the cost is the same however many rows exist. The rows can have different columns.
+    Use `load` to read all the rows, or `compact` to merge them into `output`.
+    """
     # Combine the parameters and metrics into a single dictionary
     new_data = {**parameters, **metrics}
+    line = json.dumps(new_data, ensure_ascii=False, default=str) + "\n"
+
+    with _segments_lock:
+        f = _segment(output)
+        f.write(line)
+        f.flush()
+
 
-    # Create a DataFrame from the new data
-    new_df = pd.DataFrame([new_data])
+def _read_output(output):
+    import pandas as pd
 
-    with FileLock(lock_file, timeout=60):
-        # If the file exists, read it, otherwise create an empty DataFrame
-        if os.path.isfile(output):
-            existing_df = pd.read_csv(output)
-        else:
-            existing_df = pd.DataFrame()
+    if not os.path.isfile(output):
+        return pd.DataFrame()
+    if output.endswith(".parquet"):
+        return pd.read_parquet(output)
+    return pd.read_csv(output)
 
-        # Concatenate the new DataFrame with the existing one
-        updated_df = pd.concat([existing_df, new_df], ignore_index=True)
 
-        # Save the DataFrame to a CSV file
-        updated_df.to_csv(output, index=False)
+def load(output):
+    """All the rows as a DataFrame: the compacted `output` and the segments not compacted yet."""
+    import pandas as pd
+
+    segments = sorted(glob(os.path.join(_segment_dir(output), "*.jsonl")))
+    rows = [row for segment in segments for row in read(segment)]
+    # the missing columns of the old rows are filled with NaN
+    return pd.concat([_read_output(output), pd.DataFrame(rows)], ignore_index=True)
+
+
+def compact(output):
+    """Merge the segments into `output` and remove them.
+
+    `output` is written as parquet (columnar, needs pyarrow) if it ends with `.parquet`, CSV otherwise.
+    Call it when no run is writing, e.g. after the experiment is done.
+    """
+    segments = sorted(glob(os.path.join(_segment_dir(output), "*.jsonl")))
+    df = load(output)
+
+    tmp_path = output + ".tmp"
+    if output.endswith(".parquet"):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output)
+
+    with _segments_lock:
+        pid_file = _segments.pop(output, None)
+        if pid_file is not None:
+            pid_file[1].close()
+    for segment in segments:
+        os.remove(segment)
+    try:
+        os.rmdir(_segment_dir(output))
+    except OSError:  # a new segment is there, or it is gone already
+        pass
+    return df
 
 
 if __name__ == "__main__":
@@ -35,3 +101,5 @@ if __name__ == "__main__":
     parameters = {"param1": 13, "param2": 62, "param4": 55}
     metrics = {"accuracy": 0.95, "loss": 0.05, "precision": 0.9, "abc": 111}
     save(parameters, metrics, "experiment_results.csv")
+
+    print(compact("experiment_results.csv"))
@@ -1,5 +1,6 @@
 import os
-from loguru import logger
+import tempfile
+from .log import logger
 from dataclasses import dataclass, field
 from pathlib import Path
 
@@ -8,7 +9,12 @@ def _get_dataroot():
     """Set the dataroot for different nodes."""
 
     # node config
-    return Path(os.environ["DATA_ROOT", "/data"])
+    return Path(os.environ.get("DATA_ROOT", "/data"))
+
+
+def _get_stage_root():
+    """The local disk the datasets are staged on, see `Staging`."""
+    return Path(os.environ.get("HYPO_STAGE_ROOT", os.path.join(tempfile.gettempdir(), "hypo-stage")))
 
 
 @dataclass
@@ -16,3 +22,4 @@ class Nodes:
     """Different config for each node."""
 
     dataroot: Path = field(default_factory=_get_dataroot)
+    stage_root: Path = field(default_factory=_get_stage_root)
@@ -0,0 +1,226 @@
+import importlib
+import json
+import os
+import sys
+import threading
+from .log import logger
+
+
+def _rss_mb() -> float:
+    """The current RSS of this process."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:  # not Linux, the peak instead
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 if sys.platform != "darwin" else rss / 1024**2
+
+
+def _call(target, args: list, kwargs: dict):
+    if callable(target):
+        return target(*args, **kwargs)
+    module, _, function = target.partition(":")
+    if function:
+        return getattr(importlib.import_module(module), function)(*args, **kwargs)
+    # a module entry point, as `python -m module args...`
+    import runpy
+
+    sys.argv = [module, *[str(x) for x in args]]
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def _result(value):
+    """The return value for the summary, its repr if it is not JSON."""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def _run(task) -> tuple:
+    """Run one task in the worker. Returns (returncode, result, usage, rss MB after it)."""
+    import resource
+    import traceback
+    from .usage import _usage
+
+    target, args, kwargs, cwd, env, stdout, stderr = task
+    saved = [os.dup(1), os.dup(2)]
+    environ = dict(os.environ)
+    before = _usage(resource.getrusage(resource.RUSAGE_SELF))
+    home, path = os.getcwd(), list(sys.path)
+    returncode, result = 0, None
+    try:
+        for fd, log in [(1, stdout), (2, stderr)]:
+            if log is not None:
+                with open(log, "wb") as f:
+                    os.dup2(f.fileno(), fd)
+        os.environ.update(env or {})
+        os.chdir(cwd)
+        sys.path.insert(0, str(cwd))
+        result = _result(_call(target, args or [], kwargs or {}))
+    except SystemExit as e:
+        returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in zip([1, 2], saved):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        os.chdir(home)
+        sys.path[:] = path
+        os.environ.clear()
+        os.environ.update(environ)
+    after = _usage(resource.getrusage(resource.RUSAGE_SELF))
+    used = {k: after[k] if k == "max_rss_mb" else round(after[k] - before[k], 3) for k in after}
+    return returncode, result, used, _rss_mb()
+
+
+def _serve(conn, cudas: str):
+    """The loop of a worker process: run the tasks from the pipe until None or the pipe is closed."""
+    # before anything initializes CUDA, the worker keeps these GPUs for its life
+    os.environ["CUDA_VISIBLE_DEVICES"] = cudas
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        conn.send(_run(task))
+
+
+class _Worker:
+    def __init__(self, context, cudas: str) -> None:
+        self.cudas = cudas
+        self.conn, child = context.Pipe()
+        # not a daemon, the runs could start their own processes, e.g. the data loaders
+        self.process = context.Process(target=_serve, args=(child, cudas), name=f"hypo-pool-{cudas}")
+        self.process.start()
+        child.close()
+        self.tasks = 0
+        self.rss_start = None  # after the first task, with the imports of the runs
+
+    def close(self, grace=5.0):
+        try:
+            self.conn.send(None)
+        except OSError:  # dead already
+            pass
+        self.process.join(grace)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class Pool:
+    """Pre-forked Python worker processes for the `PyRun`s, instead of a new interpreter each.
+
+    The workers are forked from a fork server which imported the `preload` modules once,
+    so a run does not pay the start of Python and the imports of torch or numpy. A worker
+    keeps the CUDA_VISIBLE_DEVICES it started with, the runs go to a worker of their GPUs.
+    A worker is recycled after `max_tasks` runs, or when its RSS grew by more than
+    `max_rss_growth` MB since its first run, e.g. by a leak or the caches of the runs.
+
+    Args:
+        preload (list): The modules imported by the fork server, e.g. ["torch", "numpy"].
+        max_tasks (int): Recycle a worker after this number of runs.
+        max_rss_growth (float): Recycle a worker when its RSS grew by this number of MB.
+        size (int): The most number of workers, `max_workers` of the launch by default.
+    """
+
+    def __init__(self, preload: list = None, max_tasks=100, max_rss_growth=2048, size: int = None) -> None:
+        self.preload = preload or []
+        self.max_tasks = max_tasks
+        self.max_rss_growth = max_rss_growth
+        self.size = size
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)  # a worker is idle again, or gone
+        self.idle = {}  # CUDA_VISIBLE_DEVICES -> [_Worker]
+        self.count = 0
+        self.context = None
+
+    def _context(self):
+        with self.lock:
+            if self.context is None:
+                import multiprocessing
+
+                self.context = multiprocessing.get_context("forkserver")
+                self.context.set_forkserver_preload(self.preload)
+            return self.context
+
+    def take(self, cudas: str) -> _Worker:
+        """An idle worker of these GPUs, or a new one. An idle worker of other GPUs makes room if it is full,
+        else it waits for a worker to be given back."""
+        evicted = None
+        with self.lock:
+            while True:
+                if self.idle.get(cudas):
+                    return self.idle[cudas].pop()
+                if self.size is None or self.count < self.size:
+                    self.count += 1
+                    break
+                other = next((k for k, v in self.idle.items() if v), None)
+                if other is not None:  # it takes the place of the evicted one
+                    evicted = self.idle[other].pop()
+                    break
+                self.released.wait()
+        if evicted is not None:
+            evicted.close()
+        return _Worker(self._context(), cudas)
+
+    def give(self, worker: _Worker, rss_mb: float = None):
+        """Put back a worker after a run, or recycle it."""
+        worker.tasks += 1
+        if rss_mb is not None and worker.rss_start is None:
+            worker.rss_start = rss_mb
+        grown = rss_mb is not None and rss_mb - worker.rss_start > self.max_rss_growth
+        if not worker.process.is_alive() or worker.tasks >= self.max_tasks or grown:
+            if grown:
+                logger.info(f"[POOL] recycle the worker of GPU {worker.cudas!r}, its RSS grew to {rss_mb:.0f}MB")
+            with self.lock:
+                self.count -= 1
+                self.released.notify()
+            worker.close()
+            return
+        with self.lock:
+            self.idle.setdefault(worker.cudas, []).append(worker)
+            self.released.notify()
+
+    def execute(self, running, cwd, timeout=None, stdout=None, stderr=None, env: dict = None):
+        """Run a `PyRun` in a worker, and wait for it. Sets its returncode, result and usage.
+
+        A run past its timeout is killed with its worker. `env` is set over the environment of
+        the worker for this run only, not CUDA_VISIBLE_DEVICES which the worker keeps.
+        """
+        worker = self.take(running.cuda_visible_devices)
+        task = (running.target, running.args, running.kwargs, cwd, env, stdout, stderr)
+        rss_mb = None
+        try:
+            worker.conn.send(task)
+            if timeout and not worker.conn.poll(timeout):
+                running.timed_out = True
+                logger.warning(f"[TIMEOUT {timeout}s] kill the pool worker {worker.process.pid}")
+                worker.process.kill()
+                worker.process.join()
+                running.returncode = worker.process.exitcode
+                return
+            running.returncode, running.result, running.usage, rss_mb = worker.conn.recv()
+        except (EOFError, OSError):  # the worker died, e.g. killed by the OOM killer
+            worker.process.join()
+            running.returncode = worker.process.exitcode
+        finally:
+            self.give(worker, rss_mb)
+
+    def close(self):
+        with self.lock:
+            workers = [w for v in self.idle.values() for w in v]
+            self.idle = {}
+            self.count = 0
+        for worker in workers:
+            worker.close()
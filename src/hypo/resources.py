@@ -1,6 +1,8 @@
-import GPUtil
+import os
 import threading
-from loguru import logger
+from collections import Counter
+from dataclasses import dataclass
+from .log import logger
 
 
 class Resources:
@@ -74,40 +76,212 @@ class GlobalResources(Resources):
 #                 )
 
 
+@dataclass
+class GPU:
+    id: int
+    memory: float = float("inf")  # free memory in MB when probed
+
+
+class GPUProvider:
+    """Where the GPUs come from. Subclass it to probe the devices in another way."""
+
+    def devices(self) -> list:
+        raise NotImplementedError
+
+
+class GPUtilProvider(GPUProvider):
+    def devices(self) -> list:
+        import GPUtil
+
+        return [GPU(g.id, g.memoryFree) for g in GPUtil.getGPUs()]
+
+
+class FakeGPUs(GPUProvider):
+    """A fake GPU inventory to test on CPU only machines. E.g. FakeGPUs([24000, 24000, 11000]),
+    or the environment variable `HYPO_FAKE_GPUS=24000,24000,11000`.
+
+    Args:
+        memory (list): The free memory in MB of each fake GPU.
+    """
+
+    def __init__(self, memory) -> None:
+        self.memory = list(memory)
+
+    def devices(self) -> list:
+        return [GPU(i, m) for i, m in enumerate(self.memory)]
+
+
+def default_provider() -> GPUProvider:
+    fake = os.environ.get("HYPO_FAKE_GPUS")
+    if fake is not None:
+        return FakeGPUs([float(x) for x in fake.split(",") if x.strip()])
+    return GPUtilProvider()
+
+
+class GPUGrant:
+    """The GPUs given to a run, `str()` is the value of CUDA_VISIBLE_DEVICES, e.g. "0,1"."""
+
+    def __init__(self, taken: dict) -> None:
+        self.taken = taken  # GPU id -> (share, memory)
+
+    @property
+    def devices(self) -> list:
+        return list(self.taken)
+
+    def __str__(self):
+        return ",".join(str(i) for i in self.taken)
+
+
 class CUDAs(Resources):
-    """Dispatch the tasks to the different cudas."""
+    """Dispatch the tasks to the different cudas, bin-packed by what the runs need.
 
-    def __init__(self, cuda_visible_devices=None, max_workers=1) -> None:
-        self.lock = threading.Lock()
+    Each GPU has a share of 1.0 and its free memory. A run needs `gpus` GPUs (1 by default),
+    each with `memory` MB free and `share` of it free. Without a share, a run takes one slot:
+    the `max_workers` slots are spread over the visible GPUs, e.g. 8 workers on 4 GPUs is
+    a share of 0.5. The fullest GPUs which still fit are picked first, so the big holes
+    are left for the big runs. With `slot`, a share takes at least the slot, for a sequence
+    of which some runs have a share and others take the slot.
+    """
+
+    def __init__(self, cuda_visible_devices=None, max_workers=1, provider: GPUProvider = None) -> None:
+        self.cond = threading.Condition()
+        probed = {d.id: d for d in (provider or default_provider()).devices()}
         if cuda_visible_devices is None:
-            cudas = set(GPUtil.getAvailable(limit=8))
+            cudas = sorted(probed)
         else:
             assert isinstance(
                 cuda_visible_devices, set
             ), "The visible devices should be set."
-            cudas = cuda_visible_devices
+            cudas = sorted(cuda_visible_devices)
 
         logger.info(f"Visible GPUs: {cuda_visible_devices}")
-        self.cudas = [list(cudas)[i % len(cudas)] for i in range(max_workers)]
+        # the GPUs not probed (e.g. no nvidia-smi) have unknown memory, only the share is counted
+        self.memory = {i: probed[i].memory if i in probed else float("inf") for i in cudas}
+        self.free_memory = dict(self.memory)
+        self.free_share = {i: 1.0 for i in cudas}
+        slots = Counter(cudas[i % len(cudas)] for i in range(max_workers)) if cudas else {}
+        self.slot_share = {i: 1 / slots[i] if slots.get(i) else 1.0 for i in cudas}
 
         if max_workers > len(cudas):
             logger.warning(
                 f"Max workers is greater than the available GPUs. More than one task will be assigned to some GPUs."
             )
-        logger.info(f"Available GPUs: {self.cudas}")
+        logger.info(f"Available GPUs: { {i: f'{self.memory[i]}MB' for i in cudas} }")
 
     def __len__(self):
-        return len(self.cudas)
+        return len(self.free_share)
 
-    def acquire(self) -> int:
+    def check(self, gpus=None, memory=None, share=None, slot=False):
+        """Raise if the request could never be granted, even when all the GPUs are free."""
+        if gpus == 0 or (gpus is None and not self.free_share):
+            return
+        fits = [i for i in self.memory if self.memory[i] >= (memory or 0) and (share or 0) <= 1]
+        if len(fits) < (gpus or 1):
+            raise Exception(f"No {gpus or 1} GPUs could fit {memory}MB and share {share} each, in {self.memory}.")
+
+    def _take(self, gpus=None, memory=None, share=None, slot=False):
+        if gpus == 0 or (gpus is None and not self.free_share):  # CPU only run, or CPU only machine
+            return GPUGrant({})
+        gpus = gpus or 1
+        memory = memory or 0
+        shares = {
+            i: self.slot_share[i] if share is None else max(share, self.slot_share[i]) if slot else share
+            for i in self.free_share
+        }
+        fits = [i for i in self.free_share if self.free_share[i] + 1e-9 >= shares[i] and self.free_memory[i] >= memory]
+        if len(fits) < gpus:
+            self.check(gpus, memory, share)
+            return None
+        fits.sort(key=lambda i: (self.free_memory[i], self.free_share[i]))
+        taken = {i: (shares[i], memory) for i in fits[:gpus]}
+        for i, (s, m) in taken.items():
+            self.free_share[i] -= s
+            self.free_memory[i] -= m
+        return GPUGrant(taken)
+
+    def try_acquire(self, gpus=None, memory=None, share=None, slot=False):
+        """The GPUs for a run, None if they are not free now."""
+        with self.cond:
+            return self._take(gpus, memory, share, slot)
+
+    def acquire(self, gpus=None, memory=None, share=None, slot=False) -> GPUGrant:
+        """Wait until the GPUs for a run are free.
+
+        Args:
+            gpus (int): The number of GPUs. 0 for a CPU only run.
+            memory (float): The memory in MB on each GPU.
+            share (float): The share of each GPU, e.g. 0.25.
+            slot (bool): Take at least the slot share.
+        """
+        with self.cond:
+            grant = self._take(gpus, memory, share, slot)
+            while grant is None:
+                self.cond.wait()
+                grant = self._take(gpus, memory, share, slot)
+            return grant
+
+    def release(self, grant: GPUGrant):
+        with self.cond:
+            for i, (s, m) in grant.taken.items():
+                self.free_share[i] += s
+                self.free_memory[i] += m
+            self.cond.notify_all()
+
+
+def default_capacities() -> dict:
+    """The counted resources of this machine: "cpu" cores and "ram" in GB."""
+    capacities = {"cpu": os.cpu_count() or 1}
+    try:
+        capacities["ram"] = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
+    except (ValueError, OSError, AttributeError):  # not POSIX
+        pass
+    return capacities
+
+
+class CountedResources(Resources):
+    """Resources with a capacity, e.g. {"cpu": 16, "ram": 64, "license": 2, "disk-io": 4}.
+
+    A run asks for several of them at once, e.g. `Run(requires={"cpu": 4, "license": 1})`,
+    and gets all of them or nothing, so it never holds some while waiting for the others.
+    """
+
+    def __init__(self, capacities: dict = None) -> None:
+        self.lock = threading.Lock()
+        self.capacity = {**default_capacities(), **(capacities or {})}
+        self.free = dict(self.capacity)
+        logger.info(f"Counted resources: {self.capacity}")
+
+    def __len__(self):
+        return len(self.capacity)
+
+    def check(self, need: dict):
+        """Raise if the request could never be granted, even when all the resources are free."""
+        for k, n in (need or {}).items():
+            if k not in self.capacity:
+                raise Exception(f"Unknown resource {k}, should be one of {list(self.capacity)}.")
+            if n > self.capacity[k]:
+                raise Exception(f"Resource {k} needs {n}, more than the capacity {self.capacity[k]}.")
+
+    def try_acquire(self, need: dict) -> bool:
+        """Take all of them, or nothing."""
         with self.lock:
-            return self.cudas.pop()
+            if any(self.free[k] < n for k, n in (need or {}).items()):
+                return False
+            for k, n in (need or {}).items():
+                self.free[k] -= n
+            return True
 
-    def release(self, idx):
+    def release(self, need: dict):
         with self.lock:
-            if isinstance(self.cudas, set):
-                self.cudas.add(idx)
-            elif isinstance(self.cudas, list):
-                self.cudas.append(idx)
-            else:
-                raise Exception("The cudas should be set or list.")
\ No newline at end of file
+            for k, n in (need or {}).items():
+                self.free[k] += n
+
+
+class Grant:
+    """What a dispatched run sequence holds until it is done: the GPUs and the counted resources,
+    of this node, or of the `node` (an `Agent`) which runs it."""
+
+    def __init__(self, cudas: GPUGrant, counted: dict, node=None) -> None:
+        self.cudas = cudas
+        self.counted = counted
+        self.node = node
@@ -0,0 +1,54 @@
+import os
+import subprocess
+from shlex import quote
+
+
+class Shell:
+    """A long-lived /bin/sh which runs the commands sent over a pipe, one after another.
+
+    A command costs a fork of the shell instead of a new `/bin/sh` and a copy of the
+    environment. Each command runs by `eval` in a subshell, so its `cd`, `exit`, variables
+    and syntax errors stay there, with the stdin from /dev/null. After it, the shell writes
+    its exit code to a status pipe, the sentinel the `run` waits for.
+    """
+
+    def __init__(self) -> None:
+        status_r, self.status_fd = os.pipe()
+        self.process = subprocess.Popen(["/bin/sh"], stdin=subprocess.PIPE, pass_fds=(self.status_fd,))
+        os.close(self.status_fd)  # the number of the write end is the same in the shell
+        self.status = os.fdopen(status_r, "rb")
+        self.alive = True
+
+    def run(self, command: str, cwd, env: dict, stdout=None, stderr=None):
+        """Run a command, and wait for it. Returns its exit code, 128 + n if killed by the signal n,
+        or None if the shell is gone.
+
+        Args:
+            env (dict): The variables set for this command, over the environment of the shell.
+            stdout, stderr (Path): The files of the output, the stdout/stderr of hypo by default.
+        """
+        exports = "".join(f"export {k}={quote(str(v))}; " for k, v in env.items())
+        redirect = "".join(f" {n}>{quote(str(p))}" for n, p in [(1, stdout), (2, stderr)] if p is not None)
+        script = f"(cd {quote(str(cwd))} && {exports}eval {quote(command)}) </dev/null{redirect}\n"
+        # not `>&fd`, dash only takes the fds 0-9
+        script += f"echo \"hypo $?\" >/dev/fd/{self.status_fd}\n"
+        try:
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+        except OSError:  # BrokenPipeError, the shell was killed
+            self.alive = False
+            return None
+        sentinel = self.status.readline().split()
+        if len(sentinel) != 2 or sentinel[0] != b"hypo":
+            self.alive = False
+            return None
+        return int(sentinel[1])
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.status.close()
+        self.alive = False
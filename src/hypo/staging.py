@@ -0,0 +1,213 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from .log import logger
+
+
+def _size(path: Path) -> int:
+    """The bytes of a file, or of all the files in a folder."""
+    if not path.is_dir():
+        return path.stat().st_size
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(folder, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Stager:
+    """How a dataset is copied onto the local disk. Subclass it to stage in another way."""
+
+    copies = True  # if the staged dataset takes its size on the local disk
+
+    def stage(self, source: Path, target: Path):
+        raise NotImplementedError
+
+
+class CopyStager(Stager):
+    def stage(self, source: Path, target: Path):
+        if source.is_dir():
+            shutil.copytree(source, target, symlinks=True)
+        else:
+            shutil.copy2(source, target)
+
+
+class RsyncStager(Stager):
+    """`rsync -a`, it copies large files of a slow file system better than Python."""
+
+    def stage(self, source: Path, target: Path):
+        src = f"{source}/" if source.is_dir() else str(source)
+        subprocess.run(["rsync", "-a", src, str(target)], check=True, capture_output=True)
+
+
+class HardlinkStager(Stager):
+    """Hard links, for a source on the same local file system: no copy, no space. Copies otherwise."""
+
+    copies = False
+
+    def stage(self, source: Path, target: Path):
+        try:
+            if source.is_dir():
+                shutil.copytree(source, target, symlinks=True, copy_function=os.link)
+            else:
+                os.link(source, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logger.warning(f"[STAGE] {source} is on another file system, copy it instead of the hard links")
+            shutil.rmtree(target, ignore_errors=True)
+            CopyStager().stage(source, target)
+
+
+_STAGERS = {"copy": CopyStager, "rsync": RsyncStager, "hardlink": HardlinkStager}
+
+
+class Staging:
+    """The datasets of the runs, staged once per node onto its local disk.
+
+    The first run which needs a dataset copies it under `root`, the other runs which need it
+    meanwhile wait for this copy, also the ones of other launches on the node (a file lock).
+    The copy is kept for the later runs and launches, until the source changes (its mtime).
+    Beyond `max_size` GB, the least recently used copies which no run is using are removed.
+    A dataset larger than that is not staged, the run reads it from its source.
+
+    Args:
+        root (str): The folder of the copies, on a local disk. `Nodes().stage_root` by default.
+        max_size (float): The most GB of all the copies.
+        backend (str | Stager): "copy", "rsync", "hardlink", or a `Stager`.
+    """
+
+    def __init__(self, root=None, max_size=100.0, backend="copy") -> None:
+        from .nodes import Nodes
+
+        self.root = Path(root or Nodes().stage_root).absolute()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.stager = _STAGERS[backend]() if isinstance(backend, str) else backend
+        self.lock = threading.Lock()
+        self.locks = {}  # entry -> lock, the runs of this process wait for one copy
+        self.held = {}  # entry -> the files of its shared lock, one per run using it
+
+    def options(self) -> dict:
+        """The args to build it again, for `hypo resume`. A `Stager` of its own is not kept."""
+        backend = next((k for k, v in _STAGERS.items() if type(self.stager) is v), None)
+        return {"root": str(self.root), "max_size": self.max_size, "backend": backend}
+
+    def _entry(self, source: Path) -> Path:
+        key = hashlib.sha1(f"{source}:{source.stat().st_mtime_ns}".encode()).hexdigest()[:12]
+        return self.root / f"{source.name}-{key}"
+
+    def _sidecar(self, entry: Path, kind: str) -> Path:
+        return self.root / f".{entry.name}.{kind}"
+
+    def acquire(self, source) -> Path:
+        """The local copy of the dataset at source, stage it if needed. The source if it does not fit."""
+        source = Path(source).absolute()
+        entry = self._entry(source)
+        # shared by the runs using it, the eviction takes it exclusively
+        use = open(self._sidecar(entry, "use"), "a")
+        fcntl.flock(use, fcntl.LOCK_SH)
+        with self.lock:
+            lock = self.locks.setdefault(entry, threading.Lock())
+        try:
+            with lock, open(self._sidecar(entry, "lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)  # released by the close
+                if not entry.exists() and not self._stage(source, entry):
+                    use.close()
+                    return source
+        except BaseException:
+            use.close()
+            raise
+        with self.lock:
+            self.held.setdefault(str(entry), []).append(use)
+        os.utime(entry)  # used, for the LRU eviction
+        return entry
+
+    def _stage(self, source: Path, entry: Path) -> bool:
+        size = _size(source) if self.stager.copies else 0
+        if not self.make_room(size, keep=entry):
+            logger.warning(f"[STAGE] {source} ({size / 1024**3:.2f}GB) does not fit in {self.max_size}GB, read it from there")
+            return False
+        start = time.time()
+        tmp = self.root / f".{entry.name}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            self.stager.stage(source, tmp)
+            self._sidecar(entry, "size").write_text(str(size))
+            os.rename(tmp, entry)  # complete, or not there at all
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if tmp.exists():
+                tmp.unlink()
+            raise
+        logger.info(f"[STAGE] {source} -> {entry}, {size / 1024**3:.2f}GB in {time.time() - start:.1f}s")
+        return True
+
+    def release(self, path):
+        """A run using the local copy at path is done."""
+        with self.lock:
+            held = self.held.get(str(path))
+            use = held.pop() if held else None
+        if use is None:  # the source, not staged
+            return
+        use.close()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def entries(self) -> list:
+        """All the copies under root, (path, size, last used), including the ones of the former launches."""
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                used = path.stat().st_mtime
+                try:
+                    size = int(self._sidecar(path, "size").read_text())
+                except (OSError, ValueError):  # a crash between the copy and its size
+                    size = _size(path)
+            except OSError:  # removed by another launch meanwhile
+                continue
+            entries.append((path, size, used))
+        return entries
+
+    def make_room(self, size: int, keep: Path = None) -> bool:
+        """Remove the least recently used copies no run is using, until `size` more bytes fit."""
+        limit = self.max_size * 1024**3
+        if size > limit:
+            return False
+        entries = sorted(self.entries(), key=lambda x: x[2])
+        total = sum(s for _, s, _ in entries)
+        for path, s, _ in entries:
+            if total + size <= limit:
+                break
+            if path == keep:
+                continue
+            with open(self._sidecar(path, "use"), "a") as use:
+                try:
+                    fcntl.flock(use, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # in use, by this launch or another one
+                    continue
+                logger.info(f"[STAGE] remove {path}, {s / 1024**3:.2f}GB")
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink()
+                # the lock files stay, a run could be waiting on them
+                try:
+                    self._sidecar(path, "size").unlink()
+                except OSError:
+                    pass
+            total -= s
+        return total + size <= limit
@@ -0,0 +1,439 @@
+import dataclasses
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from .log import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS launches (
+    id INTEGER PRIMARY KEY,
+    host TEXT, pid INTEGER, cwd TEXT, options TEXT,
+    started_at REAL, finished_at REAL, resumed_from INTEGER
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    launch INTEGER, no INTEGER, seq INTEGER, kind TEXT, name TEXT, command TEXT,
+    state TEXT, status TEXT, returncode INTEGER, attempts INTEGER,
+    pid INTEGER, pid_start INTEGER, node TEXT, gpus TEXT,
+    queued_at REAL, started_at REAL, finished_at REAL, spec TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS runs_launch_no ON runs (launch, no);
+CREATE INDEX IF NOT EXISTS runs_launch_state ON runs (launch, state);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name);
+CREATE INDEX IF NOT EXISTS runs_status_name ON runs (status, name);
+"""
+
+# the `status` of the runs which did not succeed, see `experiment._status`
+FAILED = ("failed", "killed", "timeout", "error")
+
+
+def _pid_start(pid: int):
+    """The start time of a process, in clock ticks since the boot, to tell it from a later one
+    with the same PID. None if it is gone, or not on Linux."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # the name in parentheses could hold spaces
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def alive(pid: int, pid_start: int = None) -> bool:
+    """If the process is still running, and is the same one if its start time is known."""
+    if pid is None:
+        return False
+    if pid_start is not None and os.path.exists("/proc"):
+        return _pid_start(pid) == pid_start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_FIELDS = {}  # the class of a run -> its init fields (name, default), but the resource lock
+
+
+def _spec(running, ids: dict):
+    """The init fields of a run as JSON, to build it again on `hypo resume`. None if it cannot be.
+    The fields left to their default are not kept."""
+    fields = _FIELDS.get(type(running))
+    if fields is None:
+        fields = _FIELDS[type(running)] = [
+            (f.name, f.default) for f in dataclasses.fields(running) if f.init and f.name != "resource"
+        ]
+    spec = {}
+    for name, default in fields:
+        value = getattr(running, name)
+        if value is default:
+            continue
+        if name in ("cwd", "output", "input"):
+            value = str(value)
+        elif name == "after":
+            value = [x if isinstance(x, str) else {"run": ids.get(id(x))} if hasattr(x, "_row") else str(x) for x in value]
+        elif name == "target" and callable(value):
+            if value.__module__ == "__main__" or "<" in value.__qualname__:
+                return None
+            value = f"{value.__module__}:{value.__qualname__}"
+        spec[name] = value
+    try:
+        return json.dumps(spec, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+
+
+class State:
+    """The lifecycle of every run in a SQLite database, for `hypo resume` and `hypo ls`.
+
+    A run is "queued" when it is fed, "running" with the PID of its process and its GPUs, then
+    "finished" with its exit code. The database is in WAL mode, the writes are committed every
+    `commit_every` writes or `commit_interval` seconds by a thread, so a launch killed by a
+    closed terminal loses at most the last interval, and the readers never wait for it. A finished
+    run is committed at once, `hypo resume` never runs it again. The runs of a resumed launch are
+    "resumed" once the new launch queued them, or "left" if `hypo resume` left them out.
+
+    Args:
+        path (str): The database file.
+        commit_every (int): Commit after this number of writes.
+        commit_interval (float): Commit the pending writes after this number of seconds.
+        resumed_from (int): The launch this one resumes, by `hypo resume`.
+    """
+
+    def __init__(self, path=".hypo/state.db", commit_every=1000, commit_interval=1.0, resumed_from=None) -> None:
+        self.path = path
+        self.resumed_from = resumed_from
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = connect(path)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.launch_id = None
+        self.next_no = 1  # the number of a run in this launch, the launches of a folder share the database
+        self.resumes = {}  # id of a run -> its row in the launch resumed, marked "resumed" when it is queued here
+        self.thread = None
+
+    def _write(self, sql: str, params):
+        with self.lock:
+            self.db.execute(sql, params)
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self._commit()
+
+    def _commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def _flush(self):
+        while self.thread is not None:
+            time.sleep(self.commit_interval)
+            with self.lock:
+                if self.pending:
+                    self._commit()
+
+    def _no(self, running) -> int:
+        """The number of the run in this launch. A run launched again gets a new one."""
+        with self.lock:
+            if running._row is None or running._row[0] != self.launch_id:
+                running._row, self.next_no = (self.launch_id, self.next_no), self.next_no + 1
+            return running._row[1]
+
+    def start(self, options: dict) -> int:
+        """Record a new launch with the options to launch it again. Returns its id."""
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO launches (host, pid, cwd, options, started_at, resumed_from) VALUES (?, ?, ?, ?, ?, ?)",
+                (socket.gethostname(), os.getpid(), os.getcwd(), json.dumps(options), time.time(), self.resumed_from),
+            )
+            self.launch_id = cursor.lastrowid
+            self._commit()
+        self.thread = threading.Thread(target=self._flush, name="hypo-state", daemon=True)
+        self.thread.start()
+        return self.launch_id
+
+    # <update> called by the experiment
+
+    def queued(self, running_candidate):
+        from .dag import _as_sequence
+
+        seq = _as_sequence(running_candidate)
+        ids = {id(x): self._no(x) for x in seq}
+        first = ids[id(seq[0])] if len(seq) > 1 else None
+        now = time.time()
+        for running in seq:
+            for dep in running.after or []:
+                if not isinstance(dep, (str, os.PathLike)):
+                    ids[id(dep)] = self._no(dep)
+        rows = [
+            (self.launch_id, ids[id(x)], first, type(x).__name__, x.name, x.command, now, _spec(x, ids)) for x in seq
+        ]
+        resumed = [(self.resumes.pop(id(x)),) for x in seq if id(x) in self.resumes]
+        with self.lock:  # in one commit, a resumed run is in one of the launches
+            self.db.executemany(
+                "INSERT INTO runs (launch, no, seq, kind, name, command, state, queued_at, spec)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                rows,
+            )
+            self.db.executemany("UPDATE runs SET state = 'resumed' WHERE id = ?", resumed)
+            self.pending += len(rows) + len(resumed)
+            if self.pending >= self.commit_every:
+                self._commit()
+
+    def running(self, running, node=None):
+        node = None if node is None else node.address
+        gpus = getattr(running, "cuda_visible_devices", None)
+        self._write(
+            "UPDATE runs SET state = 'running', pid = NULL, pid_start = NULL, node = ?, gpus = ?, started_at = ?,"
+            " attempts = ? WHERE launch = ? AND no = ?",
+            (node, gpus, time.time(), getattr(running, "attempts", None), self.launch_id, self._no(running)),
+        )
+
+    def spawned(self, running, pid: int):
+        self._write(
+            "UPDATE runs SET pid = ?, pid_start = ? WHERE launch = ? AND no = ?",
+            (pid, _pid_start(pid), self.launch_id, self._no(running)),
+        )
+
+    def finished(self, running_candidate):
+        from .dag import _as_sequence
+        from .experiment import _status
+
+        now = time.time()
+        rows = []
+        for running in _as_sequence(running_candidate):
+            returncode = getattr(running, "returncode", None)
+            if hasattr(running, "skipped"):
+                status = "skipped"
+            else:
+                status = _status(running) if hasattr(running, "returncode") else None
+            rows.append((status, returncode, getattr(running, "attempts", None), now, self.launch_id, self._no(running)))
+        with self.lock:
+            self.db.executemany(
+                "UPDATE runs SET state = 'finished', status = ?, returncode = ?, attempts = ?, finished_at = ?"
+                " WHERE launch = ? AND no = ?",
+                rows,
+            )
+            self._commit()  # not in the next interval, a kill meanwhile would run it again
+
+    # </update>
+
+    def close(self):
+        thread, self.thread = self.thread, None
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            if self.launch_id is not None:
+                self.db.execute("UPDATE launches SET finished_at = ? WHERE id = ?", (time.time(), self.launch_id))
+            self._commit()
+        self.db.close()
+
+
+def connect(path=".hypo/state.db") -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")  # in WAL mode, a crash of the OS could lose the last commits
+    db.executescript(_SCHEMA)
+    return db
+
+
+def query(db: sqlite3.Connection, launch=None, state=None, failed=False, name=None, limit=None) -> list:
+    """The runs by their launch ("last" for the last one), state, failed or not, and name pattern (glob)."""
+    where, params = [], []
+    if launch == "last":
+        where.append("launch = (SELECT MAX(id) FROM launches)")
+    elif launch is not None:
+        where.append("launch = ?")
+        params.append(int(launch))
+    if state is not None:
+        where.append("state = ?")
+        params.append(state)
+    if failed:
+        where.append(f"status IN ({', '.join('?' * len(FAILED))})")
+        params.extend(FAILED)
+    if name is not None:
+        where.append("name GLOB ?")
+        params.append(name)
+    sql = "SELECT * FROM runs" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return db.execute(sql, params).fetchall()
+
+
+def ls(argv: list = None):
+    """`hypo ls [--failed] [--state STATE] [--name GLOB] [--launch ID|last] [--limit N] [--json]`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hypo ls", description="The runs recorded in the state database")
+    parser.add_argument("--db", default=".hypo/state.db", help="the state database")
+    parser.add_argument("--failed", action="store_true", help="only the runs which failed, were killed or timed out")
+    parser.add_argument("--state", choices=["queued", "running", "finished", "resumed", "left"], help="only the runs in this state")
+    parser.add_argument("--name", help="only the runs with a name matching this glob pattern, e.g. 'sofa*'")
+    parser.add_argument("--launch", help="only the runs of this launch, or of the last one with 'last'")
+    parser.add_argument("--limit", type=int, help="print at most this number of runs")
+    parser.add_argument("--json", action="store_true", help="one JSON record per line")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No state database at {args.db}, launch with state=True.")
+        return 1
+    db = connect(args.db)
+    rows = query(db, args.launch, args.state, args.failed, args.name, args.limit)
+    for row in rows:
+        if args.json:
+            print(json.dumps({k: row[k] for k in row.keys() if k != "spec"}, ensure_ascii=False))
+            continue
+        where = " ".join(x for x in [row["node"], f"GPU {row['gpus']}" if row["gpus"] else None] if x)
+        code = "" if row["returncode"] is None else row["returncode"]
+        print(f"{row['id']:>8} {row['launch']:>4} {row['status'] or row['state']:<9} {code!s:>4}  {where:<20} {row['name']}")
+    db.close()
+    return 0
+
+
+def _orphans(rows: list, host: str) -> list:
+    """The running rows whose process outlived its launch, on this host."""
+    if host != socket.gethostname():
+        return []
+    return [row for row in rows if row["state"] == "running" and alive(row["pid"], row["pid_start"])]
+
+
+def _kill(pid: int):
+    import signal
+
+    try:
+        if os.getpgid(pid) == pid:  # the leader of its own group, with a timeout
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _rebuild(rows: list) -> dict:
+    """The runs of the rows, by their number in the launch. The `after` of the runs not resumed are dropped, they finished."""
+    from .experiment import Run, PyRun
+
+    built, afters = {}, {}
+    for row in rows:
+        if row["spec"] is None:
+            logger.warning(f"[RESUME] {row['name']} cannot be built again (its target or args are not JSON), skipped")
+            continue
+        spec = json.loads(row["spec"])
+        afters[row["no"]] = spec.pop("after", None)
+        built[row["no"]] = (PyRun if row["kind"] == "PyRun" else Run)(**spec)
+    for key, running in built.items():
+        after = [x if isinstance(x, str) else built.get(x["run"]) for x in afters[key] or []]
+        running.after = [x for x in after if x is not None] or None
+    return built
+
+
+def resume(argv: list = None):
+    """`hypo resume [--launch ID] [--orphans wait|kill|leave]`"""
+    import argparse
+    from .experiment import Experiment
+
+    parser = argparse.ArgumentParser(prog="hypo resume", description="Run again what a killed launch left queued or running")
+    parser.add_argument("--db", default=".hypo/state.db", help="the state database")
+    parser.add_argument("--launch", type=int, help="the launch to resume, the last one by default")
+    parser.add_argument(
+        "--orphans",
+        choices=["wait", "kill", "leave"],
+        default="wait",
+        help="the processes still running from the killed launch: wait for them to exit then run them again"
+        " (their exit code is lost with their parent), kill them and run them again, or leave them alone",
+    )
+    parser.add_argument("--force", action="store_true", help="resume even if the launch seems alive")
+    args = parser.parse_args(argv)
+    args.db = os.path.abspath(args.db)  # before the chdir into the folder of the launch
+
+    if not os.path.exists(args.db):
+        print(f"No state database at {args.db}, launch with state=True.")
+        return 1
+    db = connect(args.db)
+    if args.launch is None:
+        launch = db.execute(
+            "SELECT * FROM launches WHERE finished_at IS NULL AND id IN"
+            " (SELECT launch FROM runs WHERE state IN ('queued', 'running')) ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    else:
+        launch = db.execute("SELECT * FROM launches WHERE id = ?", (args.launch,)).fetchone()
+    if launch is None:
+        print("No launch to resume, all of them finished.")
+        return 1
+    if launch["host"] == socket.gethostname() and alive(launch["pid"]) and not args.force:
+        print(f"The launch {launch['id']} is still running as the process {launch['pid']}, --force to resume it anyway.")
+        return 1
+
+    rows = db.execute(
+        "SELECT * FROM runs WHERE launch = ? AND state IN ('queued', 'running') ORDER BY id", (launch["id"],)
+    ).fetchall()
+    orphans = _orphans(rows, launch["host"])
+    if args.orphans == "kill":
+        for row in orphans:
+            logger.warning(f"[RESUME] kill the process {row['pid']} of {row['name']}")
+            _kill(row["pid"])
+        orphans = []
+    elif args.orphans == "leave":
+        skipped = {row["id"] for row in orphans}
+        rows = [row for row in rows if row["id"] not in skipped]
+    built = _rebuild(rows)
+    # the runs left out are not resumed again, the others are marked when the new launch queued them
+    left = [row for row in rows if row["no"] not in built] + (orphans if args.orphans == "leave" else [])
+    db.executemany("UPDATE runs SET state = 'left' WHERE id = ?", [(row["id"],) for row in left])
+    db.commit()
+    db.close()
+    if args.orphans == "leave":
+        orphans = []
+
+    # the sequences, in the order they were fed
+    groups, by_seq = [], {}
+    for row in rows:
+        if row["no"] not in built:
+            continue
+        key = row["seq"] or row["no"]
+        if key not in by_seq:
+            by_seq[key] = []
+            groups.append((key, by_seq[key]))
+        by_seq[key].append(built[row["no"]])
+    late = {row["seq"] or row["no"] for row in orphans}
+    runs = [seq[0] if len(seq) == 1 else seq for key, seq in groups if key not in late]
+    logger.info(f"[RESUME] launch {launch['id']}: {sum(len(s) for _, s in groups)} runs, {len(orphans)} still running")
+
+    options = json.loads(launch["options"])
+    if options.get("staging") is not None:
+        from .staging import Staging
+
+        staging = options["staging"]
+        if staging["backend"] is None:
+            logger.warning("[RESUME] the launch staged with a Stager of its own, stage with a copy instead")
+        options["staging"] = Staging(staging["root"], staging["max_size"], staging["backend"] or "copy")
+    os.chdir(launch["cwd"])
+    exp = Experiment()
+    for k in ["summary_path", "usage_path", "journal_path"]:
+        setattr(exp, k, options.pop(k, getattr(exp, k)))
+    if orphans:  # a stream, the runs of the orphans come when they exited
+        waiting = [(row, by_seq[row["seq"] or row["no"]]) for row in orphans if (row["seq"] or row["no"]) in by_seq]
+        runs = _stream(runs, waiting)
+    state = State(args.db, resumed_from=launch["id"])
+    state.resumes = {id(built[row["no"]]): row["id"] for row in rows if row["no"] in built}
+    exp.launch(runs, state=state, **options)
+    return 0
+
+
+def _stream(runs: list, waiting: list):
+    """Yield the runs, then the run sequence of each orphan process after it exited."""
+    yield from runs
+    while waiting:
+        for item in list(waiting):
+            row, seq = item
+            if not alive(row["pid"], row["pid_start"]):
+                logger.info(f"[RESUME] the process {row['pid']} of {row['name']} exited, run it again")
+                waiting.remove(item)
+                yield seq[0] if len(seq) == 1 else seq
+        if waiting:
+            time.sleep(1)
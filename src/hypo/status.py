@@ -0,0 +1,230 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from .log import logger
+
+
+class _Shard:
+    """The counters of one thread. Only this thread writes them, so they need no lock."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = 0  # attempts
+        self.finished = 0
+        self.ok = 0  # runs recorded in the summary
+        self.failed = 0
+        self.skipped = 0
+        self.busy = 0.0  # seconds holding a run sequence
+        self.gpu_busy = {}  # GPU -> share * seconds
+        self.durations = deque(maxlen=1000)  # seconds of the last attempts
+
+
+class Status:
+    """The live state of a launch, for `hypo status`.
+
+    The workers update the shard of their own thread, and a snapshot sums all the shards,
+    so nothing is locked on the way of the dispatch. The snapshot is served as JSON on a
+    Unix socket, to everyone who connects.
+
+    Args:
+        total (int): The number of runs, None if they are streamed.
+        slots (int): The number of workers.
+        dispatcher (Dispatcher): For the number of the queued run sequences.
+        cudas (CUDAs): For the GPUs allocated now.
+    """
+
+    def __init__(self, total: int = None, slots: int = 0, dispatcher=None, cudas=None) -> None:
+        self.total = total
+        self.slots = slots
+        self.dispatcher = dispatcher
+        self.cudas = cudas
+        self.start = time.time()
+        self.local = threading.local()
+        self.shards = []
+        self.sock = None
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = _Shard(threading.current_thread().name)
+            self.shards.append(shard)
+        return shard
+
+    # <update> called by the workers
+
+    def started(self):
+        self._shard().started += 1
+
+    def finished(self, seconds: float):
+        shard = self._shard()
+        shard.finished += 1
+        shard.durations.append(seconds)
+
+    def recorded(self, ok=0, failed=0, skipped=0):
+        shard = self._shard()
+        shard.ok += ok
+        shard.failed += failed
+        shard.skipped += skipped
+
+    def granted(self, grant):
+        grant.granted_at = time.time()
+
+    def released(self, grant):
+        seconds = time.time() - grant.granted_at
+        shard = self._shard()
+        shard.busy += seconds
+        node = "" if grant.node is None else f"{grant.node.address}/"
+        for gpu, (share, _) in grant.cudas.taken.items():
+            key = f"{node}{gpu}"
+            shard.gpu_busy[key] = shard.gpu_busy.get(key, 0.0) + share * seconds
+
+    # </update>
+
+    def snapshot(self) -> dict:
+        shards = list(self.shards)
+        elapsed = max(time.time() - self.start, 1e-9)
+        count = {k: sum(getattr(s, k) for s in shards) for k in ["started", "finished", "ok", "failed", "skipped"]}
+        durations = sorted(d for s in shards for d in list(s.durations))
+        running = count["started"] - count["finished"]
+        queued = len(self.dispatcher) if self.dispatcher is not None else 0
+        recorded = count["ok"] + count["failed"] + count["skipped"]
+
+        percentiles, eta = {}, None
+        if durations:
+            for q in [50, 90, 99]:
+                percentiles[f"p{q}"] = round(durations[min(len(durations) - 1, len(durations) * q // 100)], 2)
+            mean = sum(durations) / len(durations)
+            # the streamed runs not yielded yet are not known, the ETA is then a lower bound
+            remaining = self.total - recorded if self.total is not None else queued + running
+            eta = round(max(remaining, 0) * mean / max(self.slots, 1), 1)
+
+        gpu_busy = {}
+        for s in shards:
+            for gpu, busy in dict(s.gpu_busy).items():
+                gpu_busy[gpu] = gpu_busy.get(gpu, 0.0) + busy
+        gpus = {gpu: {"busy": round(busy / elapsed, 3)} for gpu, busy in gpu_busy.items()}
+        if self.cudas is not None:
+            for gpu, free in dict(self.cudas.free_share).items():
+                gpus.setdefault(str(gpu), {"busy": 0.0})["allocated"] = round(1 - free, 3)
+
+        return {
+            "pid": os.getpid(),
+            "elapsed": round(elapsed, 1),
+            "total": self.total,
+            "queued": queued,
+            "running": running,
+            "done": count["ok"],
+            "failed": count["failed"],
+            "skipped": count["skipped"],
+            "attempts": count["started"],
+            "durations": {"n": len(durations), **percentiles},
+            "eta": eta,
+            "eta_lower_bound": self.total is None,
+            "utilization": round(sum(s.busy for s in shards) / (elapsed * max(self.slots, 1)), 3),
+            "slots": {s.name: round(s.busy / elapsed, 3) for s in shards if s.busy},
+            "gpus": gpus,
+        }
+
+    def serve(self, path=".hypo/status.sock"):
+        """Serve the snapshots on the Unix socket at `path`, in a thread."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():  # left by a launch which was killed
+            self.path.unlink()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(str(self.path))
+        self.sock.listen()
+        self.sock.settimeout(0.5)
+        self.thread = threading.Thread(target=self._serve, name="hypo-status", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.sock is not None:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:  # closed
+                return
+            try:
+                with conn:
+                    conn.sendall(json.dumps(self.snapshot()).encode())
+            except Exception as e:
+                logger.warning(f"[STATUS] {e}")
+
+    def close(self):
+        if self.sock is None:
+            return
+        sock, self.sock = self.sock, None
+        self.thread.join()
+        sock.close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def query(path=".hypo/status.sock", timeout=5.0) -> dict:
+    """The snapshot of the launch which serves at `path`."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        chunks = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    return json.loads(b"".join(chunks))
+
+
+def _duration(seconds) -> str:
+    if seconds is None:
+        return "?"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+
+def format(status: dict) -> str:
+    total = "?" if status["total"] is None else status["total"]
+    eta = ("at least " if status["eta_lower_bound"] else "") + _duration(status["eta"])
+    lines = [
+        f"runs {total}: queued {status['queued']}  running {status['running']}  done {status['done']}"
+        f"  failed {status['failed']}  skipped {status['skipped']}",
+        f"elapsed {_duration(status['elapsed'])}  ETA {eta}  workers busy {status['utilization']:.0%}",
+    ]
+    d = status["durations"]
+    if d["n"]:
+        lines.append(f"durations p50 {d['p50']}s  p90 {d['p90']}s  p99 {d['p99']}s  (last {d['n']})")
+    for gpu, g in sorted(status["gpus"].items()):
+        allocated = f"allocated {g['allocated']:.2f}  " if "allocated" in g else ""
+        lines.append(f"GPU {gpu}: {allocated}busy {g['busy']:.0%}")
+    return "\n".join(lines)
+
+
+def main(argv: list = None):
+    """`hypo status [socket] [--json] [--watch SECONDS]`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="hypo status", description="The live state of the launch in this folder")
+    parser.add_argument("path", nargs="?", default=".hypo/status.sock", help="the status socket of the launch")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON")
+    parser.add_argument("--watch", type=float, default=None, help="print it again every this number of seconds")
+    args = parser.parse_args(argv)
+
+    while True:
+        try:
+            status = query(args.path)
+        except OSError as e:
+            print(f"No launch is running at {args.path}: {e}")
+            return 1
+        print(json.dumps(status, indent=2) if args.json else format(status))
+        if args.watch is None:
+            return 0
+        time.sleep(args.watch)
+        print()
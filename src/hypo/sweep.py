@@ -0,0 +1,246 @@
+import hashlib
+import json
+import math
+import random
+from itertools import product
+
+# ===== The distributions of the random and Sobol axes, from a uniform u in [0, 1) =====
+
+
+class Uniform:
+    def __init__(self, low: float, high: float) -> None:
+        self.low, self.high = low, high
+
+    def __call__(self, u: float):
+        return self.low + u * (self.high - self.low)
+
+
+class LogUniform(Uniform):
+    """E.g. a learning rate, LogUniform(1e-5, 1e-1)."""
+
+    def __call__(self, u: float):
+        return math.exp(math.log(self.low) + u * (math.log(self.high) - math.log(self.low)))
+
+
+class IntUniform(Uniform):
+    """An int in [low, high], both included."""
+
+    def __call__(self, u: float):
+        return min(self.high, self.low + int(u * (self.high - self.low + 1)))
+
+
+class Choice:
+    def __init__(self, values: list) -> None:
+        self.values = list(values)
+
+    def __call__(self, u: float):
+        return self.values[min(len(self.values) - 1, int(u * len(self.values)))]
+
+
+# ===== Sobol sequence =====
+
+_BITS = 30
+# (degree, coefficients, initial direction numbers) of the dimensions 2.., from Joe & Kuo (2008)
+_JOE_KUO = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+
+
+def _directions(dim: int) -> list:
+    if dim == 0:
+        return [1 << (_BITS - 1 - i) for i in range(_BITS)]
+    s, a, m = _JOE_KUO[dim - 1]
+    v = [m[i] << (_BITS - 1 - i) for i in range(s)] + [0] * (_BITS - s)
+    for i in range(s, _BITS):
+        v[i] = v[i - s] ^ (v[i - s] >> s)
+        for k in range(1, s):
+            if (a >> (s - 1 - k)) & 1:
+                v[i] ^= v[i - k]
+    return v
+
+
+def sobol(n: int, dims: int):
+    """The first n points of the Sobol sequence in [0, 1)^dims, starting at 0. A power of 2 for n
+    covers the space the most evenly."""
+    assert dims <= len(_JOE_KUO) + 1, f"Sobol supports at most {len(_JOE_KUO) + 1} axes."
+    directions = [_directions(d) for d in range(dims)]
+    x = [0] * dims
+    for i in range(n):
+        yield [xi / (1 << _BITS) for xi in x]
+        c = (~i & (i + 1)).bit_length() - 1  # the lowest zero bit of i
+        x = [xi ^ v[c] for xi, v in zip(x, directions)]
+
+
+# ===== Sweep =====
+
+
+def sweep_id(params: dict) -> str:
+    """The stable id of a combination, the same in every launch and on every machine."""
+    content = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+
+class _Params(dict):
+    def __missing__(self, key):  # an axis of `when` in the other combinations
+        return ""
+
+
+def _unique(values) -> list:
+    seen, unique = set(), []
+    for v in values:
+        key = json.dumps(v, sort_keys=True, default=str)
+        if key not in seen:
+            seen.add(key)
+            unique.append(v)
+    return unique
+
+
+class Sweep:
+    """A parameter sweep, its runs are made one by one while the scheduler consumes them.
+
+    The axes are declared by blocks, the combinations are the product of all the blocks:
+    `grid` (the product of its axes), `zip` (its axes side by side), `random` and `sobol`
+    (n sampled points), `when` (more axes only for the combinations matching a condition).
+    The command, the name and the other str arguments of `Run` are templates of the
+    parameters, and of `{id}`, the stable id of the combination. An axis which a combination
+    does not have, because of `when`, is an empty string.
+
+        sweep = (
+            Sweep("python main.py --model {model} --lr {lr} {depth}", name="{model}-{id}", gpus=1)
+            .grid(model=["mlp", "resnet"])
+            .sobol(64, lr=LogUniform(1e-5, 1e-1))
+            .when({"model": "resnet"}, depth=["--depth 18", "--depth 50"])
+        )
+
+    Nothing is kept in memory, so a million combinations start right away, in constant
+    memory unless `dedup`. Pass it to `launch` or return it from a `@runs` function.
+
+    Args:
+        command (str): The template of the command.
+        name (str): The template of the run name, "{id}" by default.
+        dedup (bool): Skip the combinations already made, e.g. the points of the discrete axes of
+            `random` drawn twice. It keeps about 100 bytes per combination. `grid` and `zip` never
+            make one twice, the blocks overriding the axes of another one could.
+        **run_kwargs: The other arguments of `Run`, the str ones are templates too.
+    """
+
+    def __init__(self, command: str, name="{id}", dedup=False, **run_kwargs) -> None:
+        self.command = command
+        self.name = name
+        self.dedup = dedup
+        self.run_kwargs = run_kwargs
+        self.blocks = []  # functions: params so far -> iterable of the params added
+        self.done = set()  # ids to skip, see `resume`
+
+    def grid(self, **axes):
+        """Every combination of the values of the axes."""
+        axes = {k: _unique(v) for k, v in axes.items()}
+        keys = list(axes)
+        self.blocks.append(lambda base: (dict(zip(keys, values)) for values in product(*axes.values())))
+        return self
+
+    def zip(self, **axes):
+        """The i-th values of all the axes together, the axes have the same length."""
+        lengths = {len(v) for v in axes.values()}
+        assert len(lengths) == 1, "The zipped axes should have the same length."
+        keys = list(axes)
+        rows = _unique([list(values) for values in zip(*axes.values())])
+        self.blocks.append(lambda base: (dict(zip(keys, values)) for values in rows))
+        return self
+
+    def random(self, n: int, seed=0, **axes):
+        """n random points, the axes are distributions, e.g. `LogUniform(1e-5, 1e-1)`, or lists to choose from."""
+        axes = {k: v if callable(v) else Choice(v) for k, v in axes.items()}
+
+        def block(base):
+            # the same points for the same combination so far, in every launch
+            rng = random.Random(f"{seed}-{sweep_id(base)}")
+            for _ in range(n):
+                yield {k: dist(rng.random()) for k, dist in axes.items()}
+
+        self.blocks.append(block)
+        return self
+
+    def sobol(self, n: int, **axes):
+        """n points of the Sobol sequence, they cover the space more evenly than random ones."""
+        axes = {k: v if callable(v) else Choice(v) for k, v in axes.items()}
+        self.blocks.append(lambda base: ({k: dist(u) for (k, dist), u in zip(axes.items(), point)} for point in sobol(n, len(axes))))
+        return self
+
+    def when(self, condition, **axes):
+        """The grid of the axes for the combinations matching the condition, the others are left as they are.
+
+        Args:
+            condition: A function of the parameters, or a dict of the values to match, e.g. {"model": "resnet"}.
+        """
+        if isinstance(condition, dict):
+            match = condition
+            condition = lambda params: all(params.get(k) == v for k, v in match.items())  # noqa: E731
+        grid = Sweep("").grid(**axes).blocks[0]
+        self.blocks.append(lambda base: grid(base) if condition(base) else [{}])
+        return self
+
+    def resume(self, journal_path="summary.jsonl"):
+        """Skip the combinations which finished successfully in the journal of the former launches."""
+        from .journal import read
+
+        for record in read(journal_path):
+            for r in record if isinstance(record, list) else [record]:
+                if r.get("sweep_id") is not None and r.get("returncode") == 0:
+                    self.done.add(r["sweep_id"])
+        return self
+
+    def skip(self, ids):
+        """Skip these combinations."""
+        self.done.update(ids)
+        return self
+
+    def points(self):
+        """The (id, parameters) of the combinations, one by one."""
+        seen = set()
+
+        def walk(i, base):
+            if i == len(self.blocks):
+                yield base
+                return
+            for params in self.blocks[i](base):
+                yield from walk(i + 1, {**base, **params})
+
+        for params in walk(0, {}):
+            key = sweep_id(params)
+            if self.dedup:
+                digest = int(key, 16)  # an int takes less memory than the str
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            if key in self.done:
+                continue
+            yield key, params
+
+    def __iter__(self):
+        from .experiment import Run
+
+        for key, params in self.points():
+            values = _Params(params, id=key)
+            kwargs = {k: v.format_map(values) if isinstance(v, str) else v for k, v in self.run_kwargs.items()}
+            yield Run(
+                name=self.name.format_map(values),
+                command=self.command.format_map(values),
+                sweep_id=key,
+                params=params,
+                **kwargs,
+            )
@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+from .log import logger
+
+
+def _exitcode(status: int) -> int:
+    """The returncode of `subprocess`: the exit code, or -signal if it was killed."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _usage(rusage) -> dict:
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    rss = rusage.ru_maxrss / 1024 if sys.platform != "darwin" else rusage.ru_maxrss / 1024**2
+    return {
+        "user_s": round(rusage.ru_utime, 3),
+        "sys_s": round(rusage.ru_stime, 3),
+        "max_rss_mb": round(rss, 1),
+        "block_in": rusage.ru_inblock,
+        "block_out": rusage.ru_oublock,
+        "voluntary_ctx": rusage.ru_nvcsw,
+        "involuntary_ctx": rusage.ru_nivcsw,
+    }
+
+
+def wait(process) -> tuple:
+    """Wait for a `subprocess.Popen` to exit. Returns (returncode, usage).
+
+    The usage is the rusage of the process and of all its descendants it waited for, e.g. the
+    commands of a shell: user/sys CPU seconds, max RSS, block I/O and context switches.
+    """
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = _exitcode(status)  # reaped here, Popen must not wait for it again
+    return process.returncode, _usage(rusage)
+
+
+async def async_wait(process) -> tuple:
+    """`wait` without blocking the event loop, by a pidfd (Linux). Elsewhere, in a thread."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    if not hasattr(os, "pidfd_open"):
+        return await loop.run_in_executor(None, wait, process)
+    pidfd = os.pidfd_open(process.pid)
+    try:
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(pidfd)
+    finally:
+        os.close(pidfd)
+    return wait(process)
+
+
+def add(total: dict, usage: dict):
+    """Add the usage of a run into the usage of an experiment: the sums, and the max of the max RSS."""
+    if not usage:
+        return
+    total["runs"] = total.get("runs", 0) + 1
+    for k, v in usage.items():
+        if k in ("max_rss_mb", "peak_rss_mb"):
+            total[k] = max(total.get(k, 0), v)
+        elif isinstance(v, (int, float)):
+            total[k] = round(total.get(k, 0) + v, 3)
+
+
+class Sampler:
+    """Sample the RSS of the process trees of the running runs, for a peak memory timeline.
+
+    Every `interval` seconds, the RSS of each tracked process and all its descendants is
+    summed from `/proc`. A point (seconds since the start, MB) is kept when it changes by
+    more than `change` of the last kept one, so long runs keep short timelines.
+
+    Args:
+        interval (float): Seconds between the samples.
+        change (float): The relative change to keep a new point.
+    """
+
+    def __init__(self, interval=1.0, change=0.05) -> None:
+        self.interval = interval
+        self.change = change
+        self.lock = threading.Lock()
+        self.tracked = {}  # pid -> [start time, peak MB, timeline]
+        self.page_mb = os.sysconf("SC_PAGE_SIZE") / 1024**2
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name="hypo-sampler", daemon=True)
+        self.thread.start()
+
+    def track(self, pid: int):
+        with self.lock:
+            self.tracked[pid] = [time.time(), 0.0, []]
+
+    def untrack(self, pid: int) -> dict:
+        """Stop sampling the process. Returns its peak RSS and timeline."""
+        with self.lock:
+            _, peak, timeline = self.tracked.pop(pid, [0, 0.0, []])
+        return {"peak_rss_mb": round(peak, 1), "rss_timeline": timeline}
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _tree(self) -> tuple:
+        """The children of each pid, and the RSS in MB of each pid."""
+        children, rss = {}, {}
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/stat", "rb") as f:
+                    stat = f.read()
+            except OSError:  # exited meanwhile
+                continue
+            # the command name in the parentheses could have spaces
+            fields = stat[stat.rfind(b")") + 2 :].split()
+            pid = int(entry.name)
+            children.setdefault(int(fields[1]), []).append(pid)
+            rss[pid] = int(fields[21]) * self.page_mb
+        return children, rss
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                if not self.tracked:
+                    continue
+            try:
+                children, rss = self._tree()
+            except OSError as e:  # no /proc
+                logger.warning(f"Stop sampling the memory: {e}")
+                return
+            now = time.time()
+            with self.lock:
+                for pid, state in self.tracked.items():
+                    total_mb, stack = 0.0, [pid]
+                    while stack:
+                        p = stack.pop()
+                        total_mb += rss.get(p, 0.0)
+                        stack += children.get(p, [])
+                    start, peak, timeline = state
+                    state[1] = max(peak, total_mb)
+                    last = timeline[-1][1] if timeline else None
+                    if last is None or abs(total_mb - last) > self.change * max(last, 1):
+                        timeline.append((round(now - start, 1), round(total_mb, 1)))
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+from .log import logger
+
+
+def _git(*args, cwd) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+
+
+@lru_cache(maxsize=None)
+def toplevel(cwd: str) -> Path:
+    """The root of the git repo which contains cwd."""
+    return Path(_git("rev-parse", "--show-toplevel", cwd=cwd))
+
+
+class Worktrees:
+    """A git worktree per (repo, revision), so runs of different revisions run at the same time.
+
+    A worktree is created on the first run of its revision and reused by the later ones,
+    also by the later launches. Beyond `max_worktrees`, the least recently used worktrees
+    which no run is using are removed.
+
+    Args:
+        root (str): The folder of the worktrees.
+        max_worktrees (int): Keep at most this number of worktrees.
+    """
+
+    def __init__(self, root=".hypo/worktrees", max_worktrees=8) -> None:
+        self.root = Path(root).absolute()
+        self.max_worktrees = max_worktrees
+        self.lock = threading.RLock()
+        self.repo_locks = {}  # repo -> lock, git does not like concurrent `worktree add` in one repo
+        self.users = {}  # worktree -> number of runs using it
+
+    def _repo_lock(self, repo) -> threading.Lock:
+        with self.lock:
+            return self.repo_locks.setdefault(repo, threading.Lock())
+
+    def acquire(self, cwd, revision: str) -> Path:
+        """The worktree of the revision of the repo at cwd, create it if needed."""
+        repo = toplevel(str(cwd))
+        commit = _git("rev-parse", "--verify", f"{revision}^{{commit}}", cwd=repo)
+        repo_id = hashlib.sha1(str(repo).encode()).hexdigest()[:8]
+        worktree = self.root / f"{repo.name}-{repo_id}" / commit
+        repo_lock = self._repo_lock(repo)
+        with self.lock:  # in use from now, `prune` will not remove it
+            self.users[worktree] = self.users.get(worktree, 0) + 1
+        try:
+            with repo_lock:
+                if not worktree.exists():
+                    logger.info(f"[WORKTREE] {revision} ({commit[:8]}) at {worktree}")
+                    _git("worktree", "add", "--detach", str(worktree), commit, cwd=repo)
+            os.utime(worktree)  # used, for the LRU eviction
+        except Exception:
+            with self.lock:
+                self.users[worktree] -= 1
+            raise
+        return worktree
+
+    @staticmethod
+    def relocate(cwd, worktree: Path) -> Path:
+        """The same cwd, in the worktree."""
+        return worktree / Path(cwd).resolve().relative_to(toplevel(str(cwd)))
+
+    def release(self, worktree: Path):
+        """A run in the worktree is done."""
+        with self.lock:
+            self.users[worktree] -= 1
+        os.utime(worktree)
+        self.prune()
+
+    def paths(self) -> list:
+        """All the worktrees under root, including the ones of the former launches."""
+        if not self.root.exists():
+            return []
+        return [p for repo in self.root.iterdir() for p in repo.iterdir() if p.is_dir()]
+
+    def prune(self):
+        """Remove the least recently used worktrees beyond `max_worktrees`, if no run is using them.
+        The removals are out of the lock, the workers do not wait for git."""
+        with self.lock:
+            worktrees = sorted(self.paths(), key=lambda p: p.stat().st_mtime)
+            unused = [p for p in worktrees if self.users.get(p, 0) == 0]
+            victims = unused[: max(0, len(worktrees) - self.max_worktrees)]
+        for worktree in victims:
+            try:
+                repo = (worktree / _git("rev-parse", "--git-common-dir", cwd=worktree)).resolve().parent
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.warning(f"Failed to remove the worktree {worktree}: {e}")
+                shutil.rmtree(worktree, ignore_errors=True)
+                continue
+            # `acquire` creates a worktree under the lock of its repo: a run which took it meanwhile keeps it
+            with self._repo_lock(repo):
+                with self.lock:
+                    if self.users.get(worktree, 0) > 0 or not worktree.exists():
+                        continue
+                    self.users.pop(worktree, None)
+                logger.info(f"[WORKTREE] remove {worktree}")
+                try:
+                    _git("worktree", "remove", "--force", str(worktree), cwd=repo)
+                except (OSError, subprocess.CalledProcessError) as e:
+                    logger.warning(f"Failed to remove the worktree {worktree}: {e}")
+                    shutil.rmtree(worktree, ignore_errors=True)
@@ -0,0 +1,11 @@
+import pytest
+
+from hypo import agent
+
+
+def test_refuse_without_token(monkeypatch):
+    monkeypatch.delenv("HYPO_AGENT_TOKEN", raising=False)
+    with pytest.raises(Exception, match="HYPO_AGENT_TOKEN"):
+        agent.serve(host="0.0.0.0", port=0)
+    assert agent._loopback("127.0.0.1") and agent._loopback("::1") and agent._loopback("localhost")
+    assert not agent._loopback("0.0.0.0") and not agent._loopback("node1")
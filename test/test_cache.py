@@ -0,0 +1,29 @@
+import subprocess
+
+from hypo.cache import Cache
+from hypo.experiment import Run
+
+
+def _git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def test_revision_in_key(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git("init", "-q", cwd=repo)
+    for tag in ["A", "B"]:
+        (repo / "f").write_text(tag)
+        _git("add", "f", cwd=repo)
+        _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", tag, cwd=repo)
+        _git("tag", tag, cwd=repo)
+
+    cache = Cache(root=tmp_path / "cache", mode="use")
+    a = Run(name="m-A", command="cat f", cwd=str(repo), revision="A")
+    b = Run(name="m-B", command="cat f", cwd=str(repo), revision="B")
+    assert cache.key(a) != cache.key(b)
+
+    a.returncode = 0
+    cache.put(a)
+    assert cache.skip(Run(name="m-A", command="cat f", cwd=str(repo), revision="A")) is not None
+    assert cache.skip(b) is None
@@ -0,0 +1,57 @@
+from hypo.dag import Graph
+from hypo.experiment import Run
+
+
+def _run(name, **kwargs):
+    return Run(name=name, command="true", **kwargs)
+
+
+def _done(running, returncode=0):
+    running.returncode = returncode
+    return running
+
+
+def test_ready_after_parents():
+    graph = Graph()
+    a, b = _run("a"), _run("b")
+    c = _run("c", after=[a, b])
+    assert [graph.add(x) for x in [a, b, c]] == ["ready", "ready", "waiting"]
+    assert graph.finish(_done(a)) == ([], [])
+    assert graph.finish(_done(b)) == ([c], [])
+    d = _run("d", after=[a])
+    assert graph.add(d) == "ready"  # its parent is done already
+
+
+def test_skip_on_failure(tmp_path):
+    graph = Graph()
+    model = str(tmp_path / "model.pt")
+    train = _run("train", produces=[model])
+    evaluate = _run("eval", after=[model])
+    report = _run("report", after=[evaluate])
+    assert [graph.add(x) for x in [train, evaluate, report]] == ["ready", "waiting", "waiting"]
+    ready, skipped = graph.finish(_done(train, 1))
+    assert ready == [] and [x.name for x in skipped] == ["eval", "report"]  # and the runs after them
+    assert graph.add(_run("late", after=[evaluate])) == "skipped"
+    assert graph.active == 0
+
+
+def test_stuck():
+    graph = Graph()
+    a, b = _run("a"), _run("b")
+    a.after, b.after = [b], [a]  # a cycle
+    c = _run("c")
+    assert [graph.add(x) for x in [a, b, c]] == ["waiting", "waiting", "ready"]
+    assert graph.stuck() == []  # c could still release them
+    graph.finish(_done(c))
+    assert {x.name for x in graph.stuck()} == {"a", "b"}
+    assert graph.active == 0 and graph.stuck() == []
+
+
+def test_sequence_and_rank():
+    graph = Graph()
+    a = _run("a")
+    seq = [_run("s1", after=[a]), _run("s2")]
+    graph.declare([seq, a])  # a sequence before its parent in the list
+    assert graph.rank[id(a)] == 2 and graph.rank[id(seq)] == 1
+    assert graph.add(seq) == "waiting" and graph.add(a) == "ready"
+    assert graph.finish(_done(a)) == ([seq], [])
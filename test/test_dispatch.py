@@ -0,0 +1,63 @@
+import threading
+import time
+from queue import Empty
+
+import pytest
+
+from hypo.dispatch import Closed, Dispatcher
+
+
+def test_priority_order():
+    dispatcher = Dispatcher()
+    for item, priority in [("c", 2), ("a", 0), ("b1", 1), ("b2", 1)]:
+        dispatcher.put(item, priority=priority)
+    assert [dispatcher.get() for _ in range(4)] == ["a", "b1", "b2", "c"]  # FIFO for the same priority
+
+
+def test_acquire_skips_the_waiting():
+    dispatcher = Dispatcher()
+    for item in ["big", "small"]:
+        dispatcher.put(item)
+    assert dispatcher.get(acquire=lambda x: "grant" if x == "small" else None) == ("small", "grant")
+    with pytest.raises(Empty):
+        dispatcher.get(block=False, acquire=lambda x: None)
+    assert dispatcher.get() == "big"
+
+
+def test_back_pressure():
+    dispatcher = Dispatcher(maxsize=2)
+    dispatcher.put(1)
+    dispatcher.put(2)
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (dispatcher.put(3), done.set()))
+    thread.start()
+    assert not done.wait(0.2)  # full, the producer waits
+    dispatcher.put(4, force=True)  # a worker never waits
+    assert dispatcher.get() == 1
+    assert not done.wait(0.2)  # still 2 waiting
+    assert dispatcher.get() == 2
+    assert done.wait(5)
+    thread.join()
+    assert len(dispatcher) == 2
+
+
+def test_close():
+    dispatcher = Dispatcher()
+    dispatcher.put("a")
+    got = []
+
+    def worker():
+        try:
+            while True:
+                got.append(dispatcher.get())
+        except Closed:
+            got.append("closed")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.1)
+    dispatcher.close()  # wakes the waiting worker, once drained
+    thread.join(5)
+    assert got == ["a", "closed"]
+    with pytest.raises(Closed):
+        dispatcher.put("b")
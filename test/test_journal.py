@@ -0,0 +1,36 @@
+import json
+
+from hypo.journal import Journal, build_summary, migrate, read
+
+
+def test_torn_last_line(tmp_path):
+    path = str(tmp_path / "summary.jsonl")
+    journal = Journal(path)
+    journal.append({"name": "a"})
+    journal.append([{"name": "b1"}, {"name": "b2"}])
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"name": "c", "ret')  # killed in the middle of a write
+    assert read(path) == [{"name": "a"}, [{"name": "b1"}, {"name": "b2"}]]
+
+    # the next launch appends after it, its records are not glued to the torn line
+    journal = Journal(path)
+    journal.append({"name": "d"})
+    journal.close()
+    assert read(path)[-1] == {"name": "d"}
+
+
+def test_migrate_and_build_summary(tmp_path):
+    summary, path = str(tmp_path / "summary.json"), str(tmp_path / "summary.jsonl")
+    with open(summary, "w") as f:
+        json.dump([{"name": "old"}], f)
+    migrate(summary, path)
+    migrate(summary, path)  # once, the journal is there now
+    journal = Journal(path)
+    journal.append({"name": "new"})
+    journal.close()
+
+    assert build_summary(path, summary) == [{"name": "old"}, {"name": "new"}]
+    with open(summary) as f:
+        assert json.load(f) == [{"name": "old"}, {"name": "new"}]
+    assert not (tmp_path / "summary.json.tmp").exists()
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from hypo import metrics
+
+pd = pytest.importorskip("pandas")
+
+
+def _save_in_another_process(output):
+    code = f"from hypo import metrics; metrics.save({{'lr': 0.3}}, {{'acc': 0.7, 'f1': 0.5}}, {output!r})"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+
+
+@pytest.mark.parametrize("name", ["results.csv", "results.parquet"])
+def test_save_load_compact(tmp_path, name):
+    if name.endswith(".parquet"):
+        pytest.importorskip("pyarrow")
+    output = str(tmp_path / name)
+    metrics.save({"lr": 0.1}, {"acc": 0.9}, output)
+    _save_in_another_process(output)  # its own segment
+    assert len(os.listdir(output + ".d")) == 2
+
+    df = metrics.load(output)
+    assert len(df) == 2 and set(df.columns) == {"lr", "acc", "f1"}  # the columns of all the rows
+
+    metrics.compact(output)
+    assert not os.path.exists(output + ".d")
+    metrics.save({"lr": 0.2, "model": "mlp"}, {"acc": 0.8}, output)  # after the compaction, a new column
+    df = metrics.load(output).sort_values("lr", ignore_index=True)
+    assert list(df["lr"]) == [0.1, 0.2, 0.3]
+    assert set(df.columns) == {"lr", "acc", "f1", "model"}
+    assert pd.isna(df["f1"][0]) and df["f1"][2] == 0.5 and df["model"][1] == "mlp"
+    assert len(metrics.compact(output)) == 3
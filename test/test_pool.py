@@ -0,0 +1,48 @@
+import threading
+import time
+
+from hypo.experiment import PyRun
+from hypo.pool import Pool
+
+
+def _run(target, args, cudas="0"):
+    running = PyRun(name="p", target=target, args=args)
+    running.cuda_visible_devices = cudas
+    return running
+
+
+def test_results_and_timeout(tmp_path):
+    pool = Pool(size=2)
+    try:
+        ok = _run("operator:add", [1, 2])
+        pool.execute(ok, tmp_path)
+        assert (ok.returncode, ok.result) == (0, 3)
+
+        failed = _run("operator:truediv", [1, 0])
+        pool.execute(failed, tmp_path, stderr=str(tmp_path / "err"))
+        assert failed.returncode == 1 and "ZeroDivisionError" in (tmp_path / "err").read_text()
+
+        slow = _run("time:sleep", [30])
+        start = time.time()
+        pool.execute(slow, tmp_path, timeout=0.5)
+        assert slow.timed_out and slow.returncode != 0 and time.time() - start < 10
+        assert pool.count == 0  # the one worker, reused by the runs, is killed with the run
+    finally:
+        pool.close()
+
+
+def test_size_bound(tmp_path):
+    pool = Pool(size=1)
+    try:
+        first = pool.take("0")
+        taken = []
+        thread = threading.Thread(target=lambda: taken.append(pool.take("1")))
+        thread.start()
+        time.sleep(0.3)
+        assert taken == [] and pool.count == 1  # waits, no worker past the size
+        pool.give(first)
+        thread.join(10)
+        assert taken[0].cudas == "1" and pool.count == 1
+        pool.give(taken[0])
+    finally:
+        pool.close()
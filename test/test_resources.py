@@ -0,0 +1,67 @@
+import pytest
+
+from hypo.experiment import Experiment, Run
+from hypo.resources import CUDAs, FakeGPUs
+
+
+def _need(*runs):
+    return Experiment().gpu_need(list(runs))
+
+
+def test_one_gpu_by_default():
+    cudas = CUDAs(max_workers=2, provider=FakeGPUs([24000, 24000]))
+    a, b = cudas.try_acquire(), cudas.try_acquire()
+    assert {str(a), str(b)} == {"0", "1"}
+    assert cudas.try_acquire() is None
+    cudas.release(a)
+    assert str(cudas.try_acquire()) == str(a)
+
+
+def test_mixed_sequence_takes_the_default_gpu():
+    cudas = CUDAs(max_workers=2, provider=FakeGPUs([24000, 24000]))
+    grant = cudas.try_acquire(**_need(Run(name="prep", command="x", gpus=0), Run(name="train", command="x")))
+    assert len(grant.taken) == 1
+
+
+def test_cpu_only_sequence():
+    cudas = CUDAs(max_workers=2, provider=FakeGPUs([24000, 24000]))
+    grant = cudas.try_acquire(**_need(Run(name="a", command="x", gpus=0), Run(name="b", command="x", gpus=0)))
+    assert str(grant) == ""
+
+
+def test_default_on_cpu_only_machine():
+    cudas = CUDAs(max_workers=2, provider=FakeGPUs([]))
+    grant = cudas.try_acquire(**_need(Run(name="a", command="x", gpus=0), Run(name="b", command="x")))
+    assert str(grant) == ""
+
+
+def test_mixed_share_takes_at_least_the_slot():
+    # 2 workers on 1 GPU: a slot is half of it
+    cudas = CUDAs(max_workers=2, provider=FakeGPUs([24000]))
+    need = _need(Run(name="a", command="x", gpu_share=0.25), Run(name="b", command="x"))
+    grant = cudas.try_acquire(**need)
+    assert grant.taken[0][0] == 0.5
+    assert cudas.try_acquire(**need) is not None
+    assert cudas.try_acquire(**need) is None
+
+
+def test_multi_gpu():
+    cudas = CUDAs(max_workers=4, provider=FakeGPUs([24000, 24000, 24000, 24000]))
+    grant = cudas.try_acquire(gpus=3, share=1.0)
+    assert len(grant.taken) == 3
+    assert cudas.try_acquire(gpus=2, share=1.0) is None
+    assert str(cudas.try_acquire(gpus=1, share=1.0)) not in str(grant).split(",")
+
+
+def test_memory_fit():
+    cudas = CUDAs(max_workers=3, provider=FakeGPUs([24000, 24000, 11000]))
+    small = cudas.try_acquire(memory=8000, share=0.1)
+    assert str(small) == "2"  # the fullest GPU which fits, the big ones stay free
+    big = cudas.try_acquire(memory=20000, share=0.1)
+    assert str(big) in ("0", "1")
+    assert cudas.try_acquire(memory=20000, share=0.1) is not None
+    assert cudas.try_acquire(memory=20000, share=0.1) is None
+    with pytest.raises(Exception):
+        cudas.check(memory=30000)
+    with pytest.raises(Exception):
+        cudas.check(gpus=4)
@@ -0,0 +1,43 @@
+import time
+
+from hypo.experiment import Experiment, Run
+from hypo.journal import read
+
+
+def _launch(runs, **kwargs) -> dict:
+    Experiment().launch(runs, max_workers=2, logs="file", **kwargs)
+    return {x["name"]: x for record in read("summary.jsonl") for x in (record if isinstance(record, list) else [record])}
+
+
+def _flaky(name, fails: int, **kwargs):
+    """Fails its first `fails` attempts, counted in a file."""
+    command = f"n=$(cat {name}.n 2>/dev/null || echo 0); echo $((n + 1)) > {name}.n; test $n -ge {fails}"
+    return Run(name=name, command=command, gpus=0, **kwargs)
+
+
+def test_retries_backoff(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    start = time.time()
+    records = _launch([_flaky("ok-3rd", 2), _flaky("never", 9, retries=1)], retries=2, backoff=0.2)
+    assert time.time() - start >= 0.2 + 0.4  # 0.2s then 0.4s before the 2nd and 3rd attempts
+    assert (records["ok-3rd"]["status"], records["ok-3rd"]["attempts"]) == ("ok", 3)
+    assert (records["never"]["status"], records["never"]["attempts"]) == ("failed", 2)  # its own retries
+
+
+def test_fail_fast(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    seq = [_flaky("first", 0), _flaky("flaky", 1), _flaky("last", 0)]
+    broken = [_flaky("a", 0), _flaky("b", 9), _flaky("c", 0)]
+    records = _launch([seq, broken], retries=1, backoff=0.1, fail_fast=True)
+    # the retry starts again from the failed run
+    assert (tmp_path / "first.n").read_text().strip() == "1"
+    assert [records[x]["status"] for x in ["first", "flaky", "last"]] == ["ok", "ok", "ok"]
+    assert records["flaky"]["attempts"] == 2
+    assert records["b"]["status"] == "failed" and "c" in records and not (tmp_path / "c.n").exists()
+
+
+def test_timeout(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    start = time.time()
+    records = _launch([Run(name="hung", command="sleep 30", gpus=0, timeout=0.5)])
+    assert records["hung"]["status"] == "timeout" and time.time() - start < 15
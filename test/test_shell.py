@@ -0,0 +1,28 @@
+from hypo.experiment import Experiment, Run
+from hypo.journal import read
+from hypo.shell import Shell
+
+
+def test_exit_codes(tmp_path):
+    shell = Shell()
+    try:
+        assert shell.run("true", tmp_path, {}) == 0
+        assert shell.run("exit 3", tmp_path, {}) == 3  # in a subshell, the shell goes on
+        assert shell.run("sh -c 'kill -TERM $$'", tmp_path, {}) == 128 + 15
+        assert shell.run("if then", tmp_path, {}, stderr=tmp_path / "err") != 0  # a syntax error
+        assert shell.run("cd / && X=1", tmp_path, {}) == 0
+        assert shell.run(f'test "$(pwd)" = "{tmp_path}" && test -z "$X" && test "$Y" = "a b"', tmp_path, {"Y": "a b"}) == 0
+        assert shell.run("echo out; echo err >&2", tmp_path, {}, tmp_path / "out", tmp_path / "err") == 0
+        assert (tmp_path / "out").read_text() == "out\n" and (tmp_path / "err").read_text() == "err\n"
+        assert shell.run("kill -9 $$", tmp_path, {}) is None  # $$ is the shell itself, also in a subshell
+        assert not shell.alive
+    finally:
+        shell.close()
+
+
+def test_batch_launch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = [Run(name=f"r{i}", command=f"exit {i % 3}", gpus=0) for i in range(12)]
+    Experiment().launch(runs, max_workers=2, batch=True, logs="file")
+    records = {x["name"]: x for record in read("summary.jsonl") for x in (record if isinstance(record, list) else [record])}
+    assert {name: r["returncode"] for name, r in records.items()} == {f"r{i}": i % 3 for i in range(12)}
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from hypo.experiment import Experiment, Run
+from hypo.staging import CopyStager, Staging
+
+
+def test_datasets_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "x").write_text("x")
+    exp = Experiment()
+    running = Run(name="a", command="true", cwd="sub", datasets={"DATA": "data"})
+    running.resolve({})
+    assert running.datasets == {"DATA": str(tmp_path / "data")}
+
+    exp.staging = None
+    assert exp.stage(running) == {"DATA": str(tmp_path / "data")}
+    exp.staging = Staging(tmp_path / "stage")
+    staged = exp.stage(running)["DATA"]
+    assert staged.startswith(str(tmp_path / "stage")) and open(f"{staged}/x").read() == "x"
+    exp.leave(running)
+
+
+class _Slow(CopyStager):
+    def __init__(self) -> None:
+        self.staged = []
+
+    def stage(self, source, target):
+        self.staged.append(source.name)
+        time.sleep(0.2)
+        super().stage(source, target)
+
+
+def _dataset(root, name, size=1000):
+    path = root / name
+    path.mkdir()
+    (path / "x").write_bytes(b"x" * size)
+    return path
+
+
+def test_concurrent_acquire(tmp_path):
+    source = _dataset(tmp_path, "data")
+    stager = _Slow()
+    staging = Staging(tmp_path / "stage", backend=stager)
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(staging.acquire(source))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stager.staged == ["data"] and len(set(paths)) == 1  # one copy, the others waited for it
+    assert (paths[0] / "x").read_bytes() == b"x" * 1000
+    for path in paths:
+        staging.release(path)
+
+    # another launch on the node finds the copy
+    other = Staging(tmp_path / "stage", backend=_Slow())
+    assert other.acquire(source) == paths[0] and other.stager.staged == []
+
+
+def test_lru_eviction(tmp_path):
+    a, b, c = (_dataset(tmp_path, name) for name in "abc")
+    staging = Staging(tmp_path / "stage", max_size=2500 / 1024**3)  # two of them
+    copy_a = staging.acquire(a)
+    copy_b = staging.acquire(b)
+    staging.release(copy_b)
+    time.sleep(0.05)
+    staging.release(copy_a)  # b is the least recently used
+    copy_c = staging.acquire(c)
+    assert copy_a.exists() and copy_c.exists() and not copy_b.exists()
+
+    # c is the least recently used, but in use: a is evicted for b instead
+    staging.release(staging.acquire(a))
+    copy_b = staging.acquire(b)
+    assert copy_c.exists() and copy_b.exists() and not copy_a.exists()
+    staging.release(copy_b)
+    staging.release(copy_c)
+
+    # too large, read from its source
+    big = _dataset(tmp_path, "big", size=3000)
+    assert staging.acquire(big) == big
+    staging.release(big)
@@ -0,0 +1,52 @@
+"""`import hypo` is done by many short processes, it should stay cheap.
+
+The budgets are over the startup of a bare interpreter, the best of a few tries.
+"""
+import subprocess
+import sys
+import time
+
+IMPORT_BUDGET = 0.05  # seconds
+HELP_BUDGET = 0.15
+HEAVY = ["asyncio", "multiprocessing", "alive_progress", "GPUtil", "argparse", "loguru", "concurrent.futures"]
+
+
+def _best(code: str, tries=5) -> float:
+    best = float("inf")
+    for _ in range(tries):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_no_heavy_imports():
+    code = f"import hypo, sys; print([m for m in {HEAVY!r} if m in sys.modules])"
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    assert out.strip() == "[]", f"`import hypo` imports {out.strip()}"
+
+
+def test_no_side_effects():
+    # no argv parsing, no sys.path change
+    code = "import sys; path = list(sys.path); sys.argv = ['x', '--unknown']; import hypo; assert sys.path == path"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_import_time():
+    base = _best("pass")
+    took = _best("import hypo") - base
+    assert took < IMPORT_BUDGET, f"`import hypo` took {took * 1000:.0f}ms, the budget is {IMPORT_BUDGET * 1000:.0f}ms"
+
+
+def test_help_time():
+    base = _best("pass")
+    took = _best("import sys; sys.argv = ['hypo', '--help']; from hypo import main; main()") - base
+    assert took < HELP_BUDGET, f"`hypo --help` took {took * 1000:.0f}ms, the budget is {HELP_BUDGET * 1000:.0f}ms"
+
+
+if __name__ == "__main__":
+    test_no_heavy_imports()
+    test_no_side_effects()
+    test_import_time()
+    test_help_time()
+    print("ok")
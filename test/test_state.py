@@ -0,0 +1,149 @@
+import json
+import os
+import socket
+
+from hypo import hypo
+from hypo.experiment import Experiment, Run
+from hypo.state import State
+
+
+def _killed_launch(db: str, cwd):
+    """A launch left unfinished with a run queued, by this process, so it looks alive."""
+    state = State(db)
+    state.db.execute(
+        "INSERT INTO launches (host, pid, cwd, options, started_at) VALUES (?, ?, ?, ?, 0)",
+        (socket.gethostname(), os.getpid(), str(cwd), json.dumps({})),
+    )
+    state.launch_id = 1
+    state.queued(Run(name="a", command="true"))
+    state.db.commit()
+    state.db.close()
+
+
+def test_resume_force(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    launched = []
+    monkeypatch.setattr(Experiment, "launch", lambda self, runs, **kwargs: launched.append(list(runs)))
+    _killed_launch(".hypo/state.db", tmp_path)
+
+    assert hypo.main(["resume"]) == 1
+    assert launched == []
+    assert hypo.main(["resume", "--force"]) == 0
+    assert [x.name for x in launched[0]] == ["a"]
+
+
+def test_resume_staging(tmp_path, monkeypatch):
+    from hypo.staging import Staging
+
+    monkeypatch.chdir(tmp_path)
+    staging = Staging(tmp_path / "stage", max_size=2.0, backend="hardlink")
+    Experiment().launch([Run(name="a", command="true", gpus=0)], max_workers=1, state=True, staging=staging)
+    db = State(".hypo/state.db").db
+    db.execute("UPDATE launches SET finished_at = NULL")
+    db.execute("UPDATE runs SET state = 'queued'")
+    db.commit()
+
+    launched = []
+    monkeypatch.setattr(Experiment, "launch", lambda self, runs, **kwargs: launched.append(kwargs))
+    assert hypo.main(["resume", "--force"]) == 0  # launched by this process
+    resumed = launched[0]["staging"]
+    assert isinstance(resumed, Staging)
+    assert (resumed.root, resumed.max_size, type(resumed.stager)) == (staging.root, 2.0, type(staging.stager))
+
+
+def test_resume_db_relative(tmp_path, monkeypatch):
+    # the launch ran in another folder, the database is the one given from here
+    (tmp_path / "launch").mkdir()
+    monkeypatch.chdir(tmp_path)
+    states = []
+    monkeypatch.setattr(Experiment, "launch", lambda self, runs, state=None, **kwargs: states.append(state))
+    _killed_launch("my.db", tmp_path / "launch")
+
+    assert hypo.main(["resume", "--force", "--db", "my.db"]) == 0
+    assert states[0].path == str(tmp_path / "my.db")
+    assert not (tmp_path / "launch" / "my.db").exists()
+
+
+def test_resume_killed_at_start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = State(".hypo/state.db")
+    state.start({})
+    state.queued([Run(name="a", command="true"), Run(name="b", command="true")])
+    state._commit()
+
+    # the resumed launch dies before it queued the runs, they are still to resume
+    monkeypatch.setattr(Experiment, "launch", lambda self, runs, **kwargs: None)
+    assert hypo.main(["resume", "--force"]) == 0
+    assert hypo.main(["resume", "--force"]) == 0
+
+    launched = []
+
+    def launch(self, runs, state=None, **kwargs):
+        state.start({})
+        for item in runs:
+            launched.append([x.name for x in item])
+            state.queued(item)
+        state.close()
+
+    monkeypatch.setattr(Experiment, "launch", launch)
+    assert hypo.main(["resume", "--force"]) == 0
+    assert launched == [["a", "b"]]
+    rows = state.db.execute("SELECT launch, name, state FROM runs ORDER BY id").fetchall()
+    assert [tuple(x) for x in rows] == [(1, "a", "resumed"), (1, "b", "resumed"), (2, "a", "queued"), (2, "b", "queued")]
+    assert hypo.main(["resume", "--force"]) == 1  # the new launch finished, nothing left
+
+
+def test_spec_rebuild(tmp_path):
+    from hypo.experiment import PyRun
+    from hypo.state import _rebuild
+
+    state = State(str(tmp_path / "s.db"))
+    state.start({})
+    a = Run(name="a", command="echo a", gpus=2, gpu_memory=1000, requires={"license": 1}, produces=["a.pt"], timeout=5.0)
+    b = PyRun(name="b", target="operator:add", args=[1, 2], after=[a, "a.pt"])
+    seq = [Run(name="s1", command="true", cwd=str(tmp_path)), Run(name="s2", command="true", after=[a])]
+    lost = PyRun(name="lost", target=lambda: 1)  # cannot be imported again
+    for item in [a, b, seq, lost]:
+        state.queued(item)
+    state._commit()
+    rows = state.db.execute("SELECT * FROM runs ORDER BY id").fetchall()
+    assert rows[-1]["spec"] is None and rows[2]["seq"] == rows[3]["seq"] == rows[2]["no"]
+
+    built = {x.name: x for x in _rebuild(rows).values()}
+    assert set(built) == {"a", "b", "s1", "s2"}
+    for old in [a, b, *seq]:
+        new = built[old.name]
+        assert type(new) is type(old) and new.command == old.command
+        for field in ["gpus", "gpu_memory", "requires", "produces", "timeout", "target", "args"]:
+            assert getattr(new, field, None) == getattr(old, field, None)
+    assert built["s1"].cwd == str(tmp_path)
+    assert built["b"].after == [built["a"], "a.pt"] and built["s2"].after == [built["a"]]
+    # a parent which is not resumed (finished) is dropped
+    assert _rebuild(rows[1:2])[2].after == ["a.pt"]
+    state.close()
+
+
+def test_resume_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = State(".hypo/state.db")
+    state.start({"max_workers": 2, "logs": "file"})
+    done, left = Run(name="done", command="touch done.again", gpus=0), Run(name="left", command="touch left", gpus=0)
+    after = Run(name="after", command="test -f left && touch after", gpus=0, after=[left])
+    for item in [done, left, after]:
+        state.queued(item)
+    done.returncode = 0
+    state.finished(done)
+    state.thread = None  # killed: no finished_at
+    state.db.close()
+
+    assert hypo.main(["resume", "--force"]) == 0
+    assert (tmp_path / "left").exists() and (tmp_path / "after").exists() and not (tmp_path / "done.again").exists()
+    assert hypo.main(["ls", "--launch", "2", "--json"]) == 0
+    rows = State(".hypo/state.db").db.execute("SELECT launch, name, state, status FROM runs ORDER BY id").fetchall()
+    assert [tuple(x) for x in rows] == [
+        (1, "done", "finished", "ok"),
+        (1, "left", "resumed", None),
+        (1, "after", "resumed", None),
+        (2, "left", "finished", "ok"),
+        (2, "after", "finished", "ok"),
+    ]
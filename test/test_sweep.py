@@ -0,0 +1,33 @@
+import tracemalloc
+
+from hypo.sweep import IntUniform, Sweep, sweep_id
+
+
+def test_id_stable():
+    assert sweep_id({"lr": 0.1, "model": "mlp"}) == sweep_id({"model": "mlp", "lr": 0.1})
+    assert sweep_id({"lr": 0.1}) != sweep_id({"lr": 0.2})
+    sweep = lambda: Sweep("x {a} {b}").grid(a=[1, 2]).random(3, b=IntUniform(0, 100))  # noqa: E731
+    assert [k for k, _ in sweep().points()] == [k for k, _ in sweep().points()]
+
+
+def test_dedup():
+    points = list(Sweep("x {a}").random(50, a=[1, 2]).points())
+    assert len(points) == 50
+    points = list(Sweep("x {a}", dedup=True).random(50, a=[1, 2]).points())
+    assert sorted(p["a"] for _, p in points) == [1, 2]
+    assert len(list(Sweep("x {a} {b}").grid(a=[1, 1, 2], b=[3, 4]).points())) == 4
+    runs = list(Sweep("x {a}", name="a-{a}").grid(a=[1, 2]).skip([sweep_id({"a": 1})]))
+    assert [r.name for r in runs] == ["a-2"]
+
+
+def test_constant_memory():
+    sweep = Sweep("x {a} {b}").grid(a=range(100)).random(1000, b=IntUniform(0, 10**9))
+    points = sweep.points()
+    for _ in range(1000):
+        next(points)
+    tracemalloc.start()
+    for _ in range(50000):
+        next(points)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1024**2
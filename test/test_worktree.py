@@ -0,0 +1,28 @@
+import subprocess
+
+from hypo.worktree import Worktrees
+
+
+def _git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def test_prune(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git("init", "-q", cwd=repo)
+    for tag in ["A", "B", "C"]:
+        (repo / "f").write_text(tag)
+        _git("add", "f", cwd=repo)
+        _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", tag, cwd=repo)
+        _git("tag", tag, cwd=repo)
+
+    worktrees = Worktrees(root=tmp_path / "worktrees", max_worktrees=1)
+    a = worktrees.acquire(repo, "A")
+    b = worktrees.acquire(repo, "B")
+    worktrees.release(b)
+    assert a.exists() and not b.exists()  # A is in use, B is beyond the limit
+    worktrees.release(a)
+    c = worktrees.acquire(repo, "C")
+    worktrees.release(c)
+    assert (c / "f").read_text() == "C" and not a.exists()